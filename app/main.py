@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 import sys
-from rgwfuncs import interactive_shell
+import threading
 from modules.config import Config
 from modules.history_manager import HistoryManager
 from modules.query_processor import QueryProcessor
@@ -9,6 +9,7 @@ from modules.file_utils import FileUtils
 from modules.info import Info
 from modules.df_utils import DataFrameUtils
 from modules.db import Database
+from modules.export import Exporter
 
 class DataSlingApp:
     def __init__(self):
@@ -20,9 +21,12 @@ class DataSlingApp:
         self.info = Info()
         self.df_utils = DataFrameUtils()
         self.db = Database()
+        self.exporter = Exporter()
         self.global_namespace = {}
 
     def run(self, args):
+        args = self._apply_setting_flags(args)
+        self._preload_modules()
         self.ui.typewriter_print(f"{self.config.HEADING_COLOR}{self.config.ASCII_ART}{self.config.RESET_COLOR}")
 
         historic_mode = '--historic' in args
@@ -53,18 +57,74 @@ class DataSlingApp:
         
         try:
             self.ui.animate_loading("Initializing query run...")
-            self.query_processor.process_all_queries(filepaths, self.global_namespace, self.db.save_history_entry, historic=historic_mode)
+            runner = None
+            if self.config.get("progressive_shell") and not historic_mode:
+                runner = self.query_processor.start_background_run(filepaths, self.global_namespace, self.db.save_history_entry)
+                print(f"{self.config.CONTENT_COLOR}[INFO] Queries keep running in the background; each DataFrame appears in the shell when it is ready. Use status() and wait('df_name').{self.config.RESET_COLOR}")
+            else:
+                self.query_processor.process_all_queries(filepaths, self.global_namespace, self.db.save_history_entry, historic=historic_mode)
+            from rgwfuncs import interactive_shell
             interactive_shell(self.global_namespace)
+            if runner is not None and runner.is_alive():
+                print(f"{self.config.HEADING_COLOR}Waiting for {len(self.query_processor.status.in_flight())} running queries to finish...{self.config.RESET_COLOR}")
+                runner.join()
+            self.query_processor.writer.flush()
         except Exception as e:
             sys.stderr.write(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}\n")
             sys.exit(1)
 
+    def _preload_modules(self):
+        # pandas and rgwfuncs are only imported where they are used; warming them up
+        # here keeps their import time off the path to the first query
+        def preload():
+            try:
+                import pandas
+                import rgwfuncs
+            except ImportError:
+                pass
+        threading.Thread(target=preload, daemon=True).start()
+
+    def _apply_setting_flags(self, args):
+        remaining = []
+        for arg in args:
+            if arg == '--fast':
+                self.config.override('fast_start', True)
+            elif arg.startswith('--max-workers='):
+                self.config.override('max_workers', int(arg.split('=', 1)[1]))
+            elif arg.startswith('--preset-workers='):
+                limits = dict(self.config.get('preset_max_workers') or {})
+                for pair in arg.split('=', 1)[1].split(','):
+                    preset, _, limit = pair.partition(':')
+                    limits[preset.strip()] = int(limit)
+                self.config.override('preset_max_workers', limits)
+            elif arg == '--stream':
+                self.config.override('stream', True)
+            elif arg.startswith('--timeout='):
+                self.config.override('query_timeout', arg.split('=', 1)[1])
+            elif arg.startswith('--run-timeout='):
+                self.config.override('run_timeout', arg.split('=', 1)[1])
+            elif arg == '--progressive':
+                self.config.override('progressive_shell', True)
+            elif arg == '--lazy':
+                self.config.override('lazy_load', True)
+            elif arg == '--compact':
+                self.config.override('compact', True)
+            elif arg.startswith('--memory-budget='):
+                self.config.override('memory_budget_mb', int(arg.split('=', 1)[1]))
+            elif arg.startswith('--cache='):
+                self.config.override('cache_ttl', arg.split('=', 1)[1])
+            elif arg.startswith('--history-format='):
+                self.config.override('history_format', arg.split('=', 1)[1])
+            else:
+                remaining.append(arg)
+        return remaining
+
     def _handle_no_files(self, args):
         if args:
             sys.stderr.write(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No .sql files found in provided arguments.{self.config.RESET_COLOR}\n")
         else:
             sys.stderr.write(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No .sql files found in current directory.{self.config.RESET_COLOR}\n")
-        sys.stderr.write(f"{self.config.HEADING_COLOR}Usage:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}datasling [--historic] [<sql_file_or_directory>...]{self.config.RESET_COLOR}\n")
+        sys.stderr.write(f"{self.config.HEADING_COLOR}Usage:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}datasling [--historic] [--fast] [--max-workers=N] [--preset-workers=preset:N,...] [--history-format=parquet|feather|csv] [--cache=TTL] [--stream] [--memory-budget=MB] [--compact] [--lazy] [--progressive] [--timeout=T] [--run-timeout=T] [<sql_file_or_directory>...]{self.config.RESET_COLOR}\n")
         self.info.display()
         sys.exit(1)
 
@@ -80,8 +140,18 @@ class DataSlingApp:
         self.global_namespace['open'] = self.df_utils.open_df
         self.global_namespace['history'] = self.db.history
         self.global_namespace['clear_history'] = self.db.clear_history
-        self.global_namespace['run'] = lambda: self.query_processor.run_local(filepaths, self.global_namespace, self.db.save_history_entry)
-        self.global_namespace['historic'] = lambda df_names=None: self.history_manager.historic(df_names, self.global_namespace)
+        self.global_namespace['diff'] = self.query_processor.diff
+        self.global_namespace['pin'] = self.db.pin
+        self.global_namespace['unpin'] = self.db.unpin
+        self.global_namespace['run'] = lambda force=False: self.query_processor.run_local(filepaths, self.global_namespace, self.db.save_history_entry, force=force)
+        self.global_namespace['historic'] = lambda df_names=None, lazy=None: self.history_manager.historic(df_names, self.global_namespace, lazy)
+        self.global_namespace['pending_writes'] = self.query_processor.writer.pending_writes
+        self.global_namespace['stats'] = self.query_processor.stats
+        self.global_namespace['status'] = self.query_processor.status.show
+        self.global_namespace['pool'] = self.query_processor.pool.show
+        self.global_namespace['export_all'] = lambda format="csv", dest=None, compression=None, workers=None: self.exporter.export_all(self.global_namespace, format, dest, compression, workers)
+        self.global_namespace['sql'] = lambda query: self.query_processor.sql(query, self.global_namespace)
+        self.global_namespace['wait'] = lambda df_names=None, timeout=None: self.query_processor.wait(df_names, timeout, self.global_namespace)
         self.global_namespace['ORIGINAL_FILEPATHS'] = filepaths
 
 # Main function needed for effective PyPI Packaging
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from .config import Config
+from .file_utils import FileUtils
+
+TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_duration(value, what="duration"):
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    try:
+        if text[-1:] in TTL_UNITS:
+            return float(text[:-1]) * TTL_UNITS[text[-1]]
+        return float(text)
+    except ValueError:
+        raise ValueError(f"Invalid {what} '{value}' (use seconds or a suffix such as 30s, 15m, 2h, 1d)")
+
+class ResultCache:
+    def __init__(self, history_manager):
+        self.config = Config()
+        self.file_utils = FileUtils()
+        self.history_manager = history_manager
+
+    def parse_ttl(self, value):
+        return parse_duration(value, "cache TTL")
+
+    def ttl_for(self, options):
+        # A directive's own @ttl:: wins over the global setting, so @ttl::0 opts a query out
+        if 'ttl' in options:
+            return self.parse_ttl(options['ttl'])
+        return self.parse_ttl(self.config.get('cache_ttl'))
+
+    def lookup(self, preset, query, options, spill_as=None):
+        ttl = self.ttl_for(options)
+        if not ttl or ttl <= 0:
+            return None, None
+        since = (datetime.now() - timedelta(seconds=ttl)).isoformat()
+        return self.history_manager.get_cached_df(self.file_utils.query_hash(preset, query, options), since, spill_as)
@@ -0,0 +1,76 @@
+import threading
+import multiprocessing
+from contextlib import contextmanager
+
+_local = threading.local()
+
+class Cancellation:
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.cancelled = False
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def cancelling(self, callback):
+        # callback stops whatever the block is waiting on, e.g. interrupts the query on the server
+        with self.lock:
+            cancelled = self.cancelled
+            if not cancelled:
+                self.callbacks.append(callback)
+        if cancelled:
+            raise TimeoutError("query was cancelled")
+        try:
+            yield
+        finally:
+            with self.lock:
+                if callback in self.callbacks:
+                    self.callbacks.remove(callback)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+def current_cancellation():
+    # Jobs run by QueryExecutor get their own; anything else gets one that is never cancelled
+    return getattr(_local, 'cancellation', None) or Cancellation()
+
+def activate(cancellation):
+    _local.cancellation = cancellation
+
+def _load_query_in_child(conn, query, preset):
+    try:
+        from rgwfuncs import load_data_from_query
+        conn.send(('ok', load_data_from_query(query, preset=preset)))
+    except BaseException as e:
+        conn.send(('error', f"{type(e).__name__}: {str(e)}"))
+    finally:
+        conn.close()
+
+def load_query_in_process(query, preset, cancellation):
+    # Drivers without a way to cancel a query run in a process that can be killed instead
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_load_query_in_child, args=(sender, query, preset), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        with cancellation.cancelling(process.kill):
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                if cancellation.cancelled:
+                    raise TimeoutError("query worker process was killed")
+                raise RuntimeError("query worker process exited unexpectedly")
+    finally:
+        receiver.close()
+        process.join(timeout=5)
+    if status == 'error':
+        raise RuntimeError(payload)
+    return payload
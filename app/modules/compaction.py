@@ -0,0 +1,60 @@
+import re
+from datetime import date
+from .config import Config
+
+# ISO dates with an optional time, e.g. 2024-01-31, 2024-01-31 12:00:00, 2024-01-31T12:00:00.123
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+
+class DtypeCompactor:
+    def __init__(self):
+        self.config = Config()
+
+    def enabled(self, options):
+        compact = options.get('compact', self.config.get("compact"))
+        return str(compact).lower() in ('1', 'true', 'yes')
+
+    def compact(self, df):
+        before = int(df.memory_usage(deep=True).sum())
+        for column in df.columns:
+            df[column] = self.compact_series(df[column])
+        after = int(df.memory_usage(deep=True).sum())
+        return df, before, after
+
+    def compact_series(self, series):
+        import pandas as pd
+        kind = series.dtype.kind
+        if kind in 'iu':
+            return pd.to_numeric(series, downcast='integer')
+        if kind == 'f':
+            downcast = series.astype('float32')
+            # Only when no value changes; most decimal fractions do not survive float32
+            if ((downcast.astype('float64') == series) | series.isna()).all():
+                return downcast
+            return series
+        if kind != 'O':
+            return series
+
+        values = series.dropna()
+        if values.empty:
+            return series
+        sample = values.iloc[:1000]
+        if all(isinstance(v, date) for v in sample):
+            return self._parse_dates(series, values)
+        if not all(isinstance(v, str) for v in sample):
+            return series
+        if all(DATE_RE.match(v) for v in sample):
+            return self._parse_dates(series, values)
+        if values.nunique() <= len(series) * float(self.config.get("compact_category_ratio")):
+            return series.astype('category')
+        return series
+
+    def _parse_dates(self, series, values):
+        import pandas as pd
+        try:
+            parsed = pd.to_datetime(series, errors='coerce')
+        except (TypeError, ValueError):
+            return series
+        # A value that does not parse means this is not a date column after all
+        if parsed.notna().sum() != len(values):
+            return series
+        return parsed
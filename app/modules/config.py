@@ -1,7 +1,47 @@
 import os
+import json
 from colorama import init
 
 class Config:
+    SETTINGS_FILE = os.path.expanduser("~/.dataslingrc")
+    DEFAULT_SETTINGS = {
+        "max_workers": 8,
+        "default_preset_max_workers": 4,
+        "preset_max_workers": {},
+        "history_format": "parquet",
+        "history_compression": "zstd",
+        "cache_ttl": None,
+        "stream": False,
+        "stream_chunk_rows": 50000,
+        "memory_budget_mb": 2048,
+        "history_deltas": True,
+        "history_delta_chain": 10,
+        "history_max_mb": 10240,
+        "history_max_age": "90d",
+        "background_writes": True,
+        "history_writers": 4,
+        "history_readers": 8,
+        "lazy_load": False,
+        "progressive_shell": False,
+        "session_leases": True,
+        "query_timeout": None,
+        "run_timeout": None,
+        "partition_count": 4,
+        "partition_retries": 2,
+        "lease_timeout": 3600,
+        "compact": False,
+        "compact_category_ratio": 0.5,
+        "connection_pool": True,
+        "pool_size": 4,
+        "pool_idle_timeout": "10m",
+        "pool_check_after": 30,
+        "progress_interval": 0.2,
+        "export_workers": None,
+        "fast_start": os.environ.get("DATASLING_FAST", "") not in ("", "0"),
+    }
+    _file_settings = None
+    _overrides = {}
+
     def __init__(self):
         init()
         self.HISTORY_DIR = os.path.expanduser("~/Downloads/query_history")
@@ -23,3 +63,25 @@ class Config:
     ╠╩╗└┬┘  ╠╦╝└┬┘├─┤│││  ║ ╦├┤ ├┬┘├─┤├┬┘ ││  ║║║││  └─┐│ ││││
     ╚═╝ ┴   ╩╚═ ┴ ┴ ┴┘└┘  ╚═╝└─┘┴└─┴ ┴┴└──┴┘  ╚╩╝┴┴─┘└─┘└─┘┘└┘
         """
+
+    def get(self, key):
+        # Command line flags win over ~/.dataslingrc, which wins over defaults
+        if key in Config._overrides:
+            return Config._overrides[key]
+        return self._load_settings().get(key, self.DEFAULT_SETTINGS.get(key))
+
+    @classmethod
+    def override(cls, key, value):
+        cls._overrides[key] = value
+
+    @classmethod
+    def _load_settings(cls):
+        if cls._file_settings is None:
+            cls._file_settings = {}
+            if os.path.exists(cls.SETTINGS_FILE):
+                try:
+                    with open(cls.SETTINGS_FILE, 'r') as f:
+                        cls._file_settings = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Error reading {cls.SETTINGS_FILE}: {str(e)}")
+        return cls._file_settings
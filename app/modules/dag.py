@@ -0,0 +1,92 @@
+import re
+
+PANDAS_PRESET = 'pandas'
+# SQL over DataFrames already in the session, run by an in-memory sqlite database
+LOCAL_PRESET = 'local'
+# Handled by datasling itself, so a preset of the same name in .rgwfuncsrc would never be reached
+RESERVED_PRESETS = (PANDAS_PRESET, LOCAL_PRESET)
+# {{df_name.column}} expands to the distinct values of that column as a SQL list
+TEMPLATE_RE = re.compile(r'\{\{\s*(\w+)\.(\w+)\s*\}\}')
+NAME_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+
+class DirectiveGraph:
+    def __init__(self, all_queries):
+        self.directives = {q[0]: q for q in all_queries}
+        self.deps = {}
+        for df_name, preset, query, options in all_queries:
+            self.deps[df_name] = self._dependencies(df_name, preset, query, options)
+
+    def _dependencies(self, df_name, preset, query, options):
+        deps = [d for d in options.get('depends', '').split(',') if d]
+        deps.extend(name for name, _ in TEMPLATE_RE.findall(query))
+        if preset in (PANDAS_PRESET, LOCAL_PRESET):
+            deps.extend(name for name in NAME_RE.findall(query) if name in self.directives)
+        return sorted(set(d for d in deps if d != df_name))
+
+    def validate(self, loaded_frames):
+        errors = []
+        for df_name, deps in sorted(self.deps.items()):
+            for dep in deps:
+                if dep not in self.directives and dep not in loaded_frames:
+                    errors.append(f"'{df_name}' depends on '{dep}', which is neither a directive nor a loaded DataFrame")
+        cycle = self.find_cycle()
+        if cycle:
+            errors.append(f"Dependency cycle: {' -> '.join(cycle)}")
+        if errors:
+            raise ValueError("Invalid directive dependencies:\n  " + "\n  ".join(errors))
+
+    def find_cycle(self):
+        state = {}
+        stack = []
+
+        def visit(node):
+            state[node] = 'visiting'
+            stack.append(node)
+            for dep in self.deps.get(node, []):
+                if dep not in self.directives:
+                    continue
+                if state.get(dep) == 'visiting':
+                    return stack[stack.index(dep):] + [dep]
+                if dep not in state:
+                    cycle = visit(dep)
+                    if cycle:
+                        return cycle
+            stack.pop()
+            state[node] = 'done'
+            return None
+
+        for node in sorted(self.directives):
+            if node not in state:
+                cycle = visit(node)
+                if cycle:
+                    return cycle
+        return None
+
+    def downstream_of(self, df_names):
+        # Every directive that directly or transitively consumes one of df_names
+        affected = set(df_names)
+        changed = True
+        while changed:
+            changed = False
+            for df_name, deps in self.deps.items():
+                if df_name not in affected and affected.intersection(deps):
+                    affected.add(df_name)
+                    changed = True
+        return affected
+
+    def critical_path(self, durations):
+        memo = {}
+
+        def longest(node):
+            if node not in memo:
+                best_time, best_path = 0.0, []
+                for dep in self.deps.get(node, []):
+                    if dep in durations:
+                        dep_time, dep_path = longest(dep)
+                        if dep_time > best_time:
+                            best_time, best_path = dep_time, dep_path
+                memo[node] = (best_time + durations[node], best_path + [node])
+            return memo[node]
+
+        paths = [longest(node) for node in durations]
+        return max(paths, key=lambda p: p[0]) if paths else (0.0, [])
@@ -1,85 +1,252 @@
 import sqlite3
 from datetime import datetime
+from contextlib import contextmanager
 import io
 import sys
 import time
 import os
+import threading
 from .config import Config
 from .df_utils import DataFrameUtils
+from .file_utils import FileUtils
+from .profiling import QueryProfile, PHASES, format_bytes
+from .retention import HistoryRetention
+from .delta import DeltaStorage
+
+def _migrate_base_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS query_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT,
+                    df_name TEXT,
+                    preset TEXT,
+                    query TEXT,
+                    file_path TEXT,
+                    printed_output TEXT
+                 )''')
+    # Databases created by earlier releases may already carry some of these columns
+    columns = [row[1] for row in c.execute('PRAGMA table_info(query_history)')]
+    for column in ('file_format', 'query_hash', 'fingerprint', 'status'):
+        if column not in columns:
+            c.execute(f'ALTER TABLE query_history ADD COLUMN {column} TEXT')
+
+def _migrate_indexes(c):
+    c.execute('CREATE INDEX IF NOT EXISTS idx_query_history_df_name_timestamp ON query_history (df_name, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_query_history_query_hash_timestamp ON query_history (query_hash, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_query_history_timestamp ON query_history (timestamp)')
+
+def _migrate_query_stats(c):
+    for phase in PHASES:
+        c.execute(f'ALTER TABLE query_history ADD COLUMN {phase}_s REAL')
+    for column in ('row_count', 'byte_size', 'peak_mem'):
+        c.execute(f'ALTER TABLE query_history ADD COLUMN {column} INTEGER')
+
+def _migrate_col_count(c):
+    c.execute('ALTER TABLE query_history ADD COLUMN col_count INTEGER')
+
+def _migrate_retention(c):
+    c.execute('ALTER TABLE query_history ADD COLUMN last_used TEXT')
+    c.execute('ALTER TABLE query_history ADD COLUMN pinned INTEGER DEFAULT 0')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_query_history_file_path ON query_history (file_path)')
+
+def _migrate_delta_storage(c):
+    c.execute('ALTER TABLE query_history ADD COLUMN base_path TEXT')
+
+def _migrate_mem_estimate(c):
+    # The value is an estimate from frame sizes, never a measured peak
+    c.execute('ALTER TABLE query_history RENAME COLUMN peak_mem TO mem_estimate')
+
+# Each migration runs once; PRAGMA user_version records how many have been applied
+MIGRATIONS = [
+    _migrate_base_schema,
+    _migrate_indexes,
+    _migrate_query_stats,
+    _migrate_col_count,
+    _migrate_retention,
+    _migrate_delta_storage,
+    _migrate_mem_estimate,
+]
+
+class HistoryConnection:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.lock = threading.RLock()
+        self.batch_depth = 0
+        self.migrate()
+
+    @classmethod
+    def get(cls, db_path):
+        with cls._instances_lock:
+            if db_path not in cls._instances:
+                cls._instances[db_path] = cls(db_path)
+            return cls._instances[db_path]
+
+    def migrate(self):
+        with self.lock:
+            if self.conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+                return
+            # Sessions starting together would otherwise both apply the same migration; the write
+            # lock makes one wait, and it reads the version again once the other has finished
+            self.conn.execute('BEGIN IMMEDIATE')
+            c = self.conn.cursor()
+            try:
+                version = c.execute('PRAGMA user_version').fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                    migration(c)
+                    c.execute(f'PRAGMA user_version = {number}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                c.close()
+
+    @contextmanager
+    def cursor(self):
+        with self.lock:
+            c = self.conn.cursor()
+            try:
+                yield c
+                if self.batch_depth == 0:
+                    self.conn.commit()
+            except Exception:
+                if self.batch_depth == 0:
+                    self.conn.rollback()
+                raise
+            finally:
+                c.close()
+
+    @contextmanager
+    def batch(self):
+        # Writes made inside the block share one transaction, committed when it ends
+        with self.lock:
+            self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.batch_depth -= 1
+                if self.batch_depth == 0:
+                    self.conn.commit()
 
 class Database:
     def __init__(self):
         self.config = Config()
         self.df_utils = DataFrameUtils()
+        self.file_utils = FileUtils()
+        self.retention = HistoryRetention(self)
+        self.deltas = DeltaStorage(self)
+
+    @property
+    def connection(self):
+        return HistoryConnection.get(self.config.HISTORY_DB)
+
+    def batch(self):
+        return self.connection.batch()
 
     def init_history_db(self):
-        conn = sqlite3.connect(self.config.HISTORY_DB)
-        c = conn.cursor()
-
-        c.execute('''CREATE TABLE IF NOT EXISTS query_history (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp TEXT,
-                        df_name TEXT,
-                        preset TEXT,
-                        query TEXT,
-                        file_path TEXT,
-                        printed_output TEXT
-                     )''')
-
-        c.execute('SELECT COUNT(*) FROM query_history')
-        total_entries = c.fetchone()[0]
-
-        if total_entries > 100:
-            c.execute('''SELECT file_path
-                         FROM query_history
-                         WHERE id NOT IN (
-                             SELECT id FROM query_history
-                             ORDER BY timestamp DESC
-                             LIMIT 40
-                         ) AND file_path IS NOT NULL''')
-            old_file_paths = [row[0] for row in c.fetchall()]
-
-            c.execute('''DELETE FROM query_history
-                         WHERE id NOT IN (
-                             SELECT id FROM query_history
-                             ORDER BY timestamp DESC
-                             LIMIT 40
-                         )''')
-
-            conn.commit()
-            conn.close()
-
-            for file_path in old_file_paths:
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        print(f"{self.config.HEADING_COLOR}Deleted old file:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{file_path}{self.config.RESET_COLOR}")
-                except OSError as e:
-                    print(f"{self.config.HEADING_COLOR}Error deleting file {file_path}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+        # Opening the connection applies pending migrations; eviction never holds up startup
+        self.connection
+        self.retention.schedule()
+
+    def touch(self, file_paths):
+        file_paths = [file_path for file_path in dict.fromkeys(file_paths) if file_path]
+        if not file_paths:
+            return
+        now = datetime.now().isoformat()
+        for start in range(0, len(file_paths), 500):
+            chunk = file_paths[start:start + 500]
+            with self.connection.cursor() as c:
+                c.execute(f"UPDATE query_history SET last_used = ? WHERE file_path IN ({','.join('?' for _ in chunk)})", [now] + chunk)
+
+    def pin(self, df_name=None):
+        if df_name is None:
+            self.show_pinned()
+            return
+        with self.connection.cursor() as c:
+            row = c.execute("""SELECT file_path, timestamp FROM query_history
+                               WHERE df_name = ? AND file_path IS NOT NULL
+                               ORDER BY timestamp DESC LIMIT 1""", (df_name,)).fetchone()
+            if row:
+                c.execute("UPDATE query_history SET pinned = 1 WHERE file_path = ?", (row[0],))
+        if not row:
+            print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No saved result for {df_name}{self.config.RESET_COLOR}")
+            return
+        print(f"{self.config.HEADING_COLOR}Pinned {df_name}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}the result saved at {row[1]} is kept until unpin('{df_name}'){self.config.RESET_COLOR}")
+
+    def unpin(self, df_name):
+        with self.connection.cursor() as c:
+            c.execute("""UPDATE query_history SET pinned = 0
+                         WHERE file_path IN (SELECT file_path FROM query_history WHERE df_name = ? AND pinned = 1)""", (df_name,))
+            count = c.rowcount
+        if count:
+            print(f"{self.config.HEADING_COLOR}Unpinned {df_name}{self.config.RESET_COLOR}")
         else:
-            conn.close()
+            print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{df_name} is not pinned{self.config.RESET_COLOR}")
+        self.retention.schedule()
 
-    def save_history_entry(self, df_name, preset, query, df=None):
-        file_path = self.df_utils.save_df_to_csv(df) if df is not None else None
+    def show_pinned(self):
+        with self.connection.cursor() as c:
+            rows = c.execute("""SELECT df_name, MAX(timestamp), file_path FROM query_history
+                                WHERE pinned = 1 AND file_path IS NOT NULL
+                                GROUP BY file_path ORDER BY df_name""").fetchall()
+        if not rows:
+            print(f"{self.config.HEADING_COLOR}Pinned:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No pinned results.{self.config.RESET_COLOR}")
+            return
+        print(f"{self.config.HEADING_COLOR}Pinned results:{self.config.RESET_COLOR}")
+        for df_name, timestamp, file_path in rows:
+            size = os.path.getsize(file_path) if os.path.exists(file_path) else None
+            print(f"{self.config.CONTENT_COLOR}  {df_name}  saved {timestamp}  {format_bytes(size)}{self.config.RESET_COLOR}")
+
+    def save_history_entry(self, df_name, preset, query, df=None, cacheable=True, spilled=None, profile=None, status=None, options=None):
+        row = self.prepare_history_entry(df_name, preset, query, df=df, cacheable=cacheable, spilled=spilled, profile=profile, status=status, options=options)
+        self.insert_history_entries([row])
+        return row[4]
+
+    def prepare_history_entry(self, df_name, preset, query, df=None, cacheable=True, spilled=None, profile=None, status=None, options=None):
+        profile = profile or QueryProfile()
+        file_path, file_format, base_path = None, None, None
         printed_output = None
 
         if df is not None:
+            with profile.phase('persist'):
+                file_path, file_format, base_path = self.deltas.save(df_name, df)
+            profile.row_count, profile.col_count = df.shape
+            profile.byte_size = int(df.memory_usage(deep=True).sum())
+            if profile.mem_estimate is None:
+                # Fetched rows and the frame built from them are alive together
+                profile.estimate_memory(profile.byte_size * 2)
             buffer = io.StringIO()
             print(df.head(10), file=buffer)
             printed_output = buffer.getvalue()
+        elif spilled is not None:
+            # Streamed and lazily loaded results are already on disk, only the entry is recorded
+            file_path, file_format = spilled.file_path, spilled.file_format
+            profile.row_count, profile.col_count = spilled.row_count, spilled.col_count
+            if isinstance(spilled.preview, str) or spilled.preview is None:
+                printed_output = spilled.preview
+            else:
+                buffer = io.StringIO()
+                print(spilled.preview, file=buffer)
+                printed_output = buffer.getvalue()
 
-        conn = sqlite3.connect(self.config.HISTORY_DB)
-        c = conn.cursor()
-        c.execute("""INSERT INTO query_history (timestamp, df_name, preset, query, file_path, printed_output)
-                     VALUES (?, ?, ?, ?, ?, ?)""",
-                  (datetime.now().isoformat(), df_name, preset, query, file_path, printed_output))
-        conn.commit()
-        conn.close()
-        return file_path
+        status = status or ('ok' if file_path else 'error')
+        return (datetime.now().isoformat(), df_name, preset, query, file_path, printed_output, file_format,
+                self.file_utils.query_hash(preset, query, options) if cacheable else None,
+                self.file_utils.directive_fingerprint(df_name, preset, query, options) if status != 'historic' else None, status) + profile.as_row() + (base_path,)
+
+    def insert_history_entries(self, rows):
+        with self.connection.cursor() as c:
+            c.executemany("""INSERT INTO query_history (timestamp, df_name, preset, query, file_path, printed_output, file_format, query_hash,
+                                                         fingerprint, status, queue_s, connect_s, execute_s, fetch_s, build_s,
+                                                         persist_s, row_count, byte_size, mem_estimate, col_count, base_path)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
 
     def history(self, limit=10):
-        conn = sqlite3.connect(self.config.HISTORY_DB)
-        c = conn.cursor()
         query = """
             SELECT timestamp, df_name, preset, query, file_path, printed_output
             FROM (
@@ -90,21 +257,21 @@ class Database:
             ) AS last_entries
             ORDER BY timestamp ASC;
         """
-        c.execute(query, (limit,))
-        rows = c.fetchall()
-        conn.close()
+        with self.connection.cursor() as c:
+            rows = c.execute(query, (limit,)).fetchall()
 
         if not rows:
             print(f"{self.config.HEADING_COLOR}History:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No query history available.{self.config.RESET_COLOR}")
             return
 
+        pause = 0 if self.config.get("fast_start") else 1
         for i, (timestamp, df_name, preset, query_text, file_path, printed_output) in enumerate(rows, 1):
             sys.stdout.write(f"{self.config.HEADING_COLOR}History Entry {i} ")
             sys.stdout.flush()
             for _ in range(3):
                 sys.stdout.write(f"{self.config.HEADING_COLOR}.")
                 sys.stdout.flush()
-                time.sleep(0.1)
+                time.sleep(0.1 * pause)
             sys.stdout.write(f"{self.config.HEADING_COLOR} (Timestamp: {timestamp}){self.config.RESET_COLOR}\n")
             sys.stdout.flush()
             print(f"{self.config.HEADING_COLOR}  DataFrame:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{df_name}{self.config.RESET_COLOR}")
@@ -121,12 +288,52 @@ class Database:
             else:
                 print(f"{self.config.HEADING_COLOR}  File:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Not saved{self.config.RESET_COLOR}")
             print()
-            time.sleep(0.2)
+            time.sleep(0.2 * pause)
+
+    def stats(self, limit=10, runs=5):
+        query = f"""
+            SELECT df_name, timestamp, status, {', '.join(f'{phase}_s' for phase in PHASES)}, row_count, byte_size, mem_estimate
+            FROM query_history
+            WHERE {' OR '.join(f'{phase}_s IS NOT NULL' for phase in PHASES if phase not in ('queue', 'persist'))}
+            ORDER BY timestamp DESC
+        """
+        with self.connection.cursor() as c:
+            rows = c.execute(query).fetchall()
+
+        by_name = {}
+        for row in rows:
+            recent = by_name.setdefault(row[0], [])
+            if len(recent) < runs:
+                recent.append(row)
+
+        if not by_name:
+            print(f"{self.config.HEADING_COLOR}Stats:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No profiled queries yet.{self.config.RESET_COLOR}")
+            return
+
+        def cost(row):
+            # Time spent on the query itself; waiting for a worker slot is shown separately
+            return sum(value or 0 for value in row[4:3 + len(PHASES)])
+
+        ranked = sorted(by_name.items(), key=lambda item: sum(cost(r) for r in item[1]) / len(item[1]), reverse=True)
+        print(f"{self.config.HEADING_COLOR}Query stats (last {runs} runs per DataFrame, most expensive first):{self.config.RESET_COLOR}")
+        for rank, (df_name, recent) in enumerate(ranked[:limit], 1):
+            latest = recent[0]
+            average = sum(cost(r) for r in recent) / len(recent)
+            trend = ""
+            if len(recent) > 1:
+                previous = sum(cost(r) for r in recent[1:]) / (len(recent) - 1)
+                if previous > 0:
+                    trend = f" ({(cost(latest) - previous) / previous * 100:+.0f}% vs previous runs)"
+            print(f"{self.config.HEADING_COLOR}{rank:3d}. {df_name}{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}avg {average:.2f}s  latest {cost(latest):.2f}s{trend}"
+                  f"{'  [' + latest[2] + ']' if latest[2] != 'ok' else ''}{self.config.RESET_COLOR}")
+            phases = " | ".join(f"{phase} {value:.2f}s" for phase, value in zip(PHASES, latest[3:3 + len(PHASES)]) if value is not None)
+            print(f"{self.config.CONTENT_COLOR}     phases:  {phases}{self.config.RESET_COLOR}")
+            row_count, byte_size, mem_estimate = latest[3 + len(PHASES):]
+            print(f"{self.config.CONTENT_COLOR}     rows: {row_count if row_count is not None else '-'}  size: {format_bytes(byte_size)}  estimated memory: {format_bytes(mem_estimate)}{self.config.RESET_COLOR}")
+            print(f"{self.config.CONTENT_COLOR}     recent runs: {', '.join(f'{cost(r):.2f}s' for r in reversed(recent))}{self.config.RESET_COLOR}")
+        print()
 
     def clear_history(self):
-        conn = sqlite3.connect(self.config.HISTORY_DB)
-        c = conn.cursor()
-        c.execute("DELETE FROM query_history")
-        conn.commit()
-        conn.close()
+        with self.connection.cursor() as c:
+            c.execute("DELETE FROM query_history")
         print(f"{self.config.HEADING_COLOR}Query history cleared!{self.config.RESET_COLOR}")
@@ -0,0 +1,143 @@
+import os
+import json
+from .config import Config
+
+# Formats that keep dtypes exactly, so rows taken from different files line up
+DELTA_FORMATS = ("parquet", "feather")
+# A sidecar holds an 8-byte hash per row; results stored in fewer bytes per row than this are
+# kept whole without one, since the hashes would cost about as much as any delta saves
+MIN_ROW_BYTES = 32
+
+def rows_path(file_path):
+    return file_path + ".rows.npz"
+
+def row_hashes(df):
+    import pandas as pd
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def schema(df):
+    return [str(column) for column in df.columns], [str(dtype) for dtype in df.dtypes]
+
+def read_rows(file_path):
+    import numpy as np
+    path = rows_path(file_path)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        rows = json.loads(str(data['meta']))
+        rows['hashes'] = data['hashes']
+        if 'source_runs' in data:
+            rows['source'] = decode_source(data['source_runs'])
+        elif 'source' in data:
+            # Written before sources were stored as runs
+            rows['source'] = data['source']
+    return rows
+
+def encode_source(source):
+    # Unchanged rows mostly keep their order, so source is stored as runs: (first value, length)
+    # pairs, counting up through positions in the base and down through rows in the delta
+    import numpy as np
+    if not len(source):
+        return np.zeros((2, 0), dtype=np.int64)
+    in_base = source >= 0
+    step = np.where(in_base, 1, -1)
+    breaks = np.flatnonzero((np.diff(source) != step[1:]) | (in_base[1:] != in_base[:-1])) + 1
+    starts = np.concatenate([[0], breaks])
+    lengths = np.diff(np.append(starts, len(source)))
+    return np.stack([source[starts], lengths])
+
+def decode_source(runs):
+    import numpy as np
+    firsts, lengths = runs[0], runs[1]
+    values = np.repeat(firsts, lengths)
+    offsets = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return values + offsets * np.where(values >= 0, 1, -1)
+
+def worth_tracking(file_path, row_count):
+    return row_count > 0 and os.path.getsize(file_path) >= MIN_ROW_BYTES * row_count
+
+def write_rows(file_path, df, hashes, source=None, base=None, base_format=None, depth=0, row_bytes=None):
+    import numpy as np
+    columns, dtypes = schema(df)
+    meta = json.dumps({'columns': columns, 'dtypes': dtypes, 'base': base, 'base_format': base_format, 'depth': depth,
+                       'row_bytes': row_bytes})
+    arrays = {'hashes': hashes, 'meta': np.array(meta)}
+    if source is not None:
+        arrays['source_runs'] = encode_source(source)
+    # np.savez appends .npz to names without it; write under a temporary name so readers never see half a file
+    tmp_path = rows_path(file_path)[:-len(".npz")] + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, rows_path(file_path))
+
+def assemble(base, added, rows):
+    # source holds, for each row of the version, its position in the base (>= 0)
+    # or -(k + 1) for the k-th row stored in the delta itself
+    import numpy as np
+    import pandas as pd
+    source = rows['source']
+    positions = np.where(source >= 0, source, len(base) - source - 1)
+    df = pd.concat([base, added], ignore_index=True).iloc[positions].reset_index(drop=True)
+    for column, dtype in zip(df.columns, rows['dtypes']):
+        if str(df[column].dtype) != dtype:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    return df
+
+class DeltaStorage:
+    def __init__(self, db):
+        self.config = Config()
+        self.db = db
+
+    def enabled(self):
+        return bool(self.config.get("history_deltas"))
+
+    def previous(self, df_name):
+        with self.db.connection.cursor() as c:
+            return c.execute("""SELECT file_path, file_format FROM query_history
+                                WHERE df_name = ? AND file_path IS NOT NULL
+                                ORDER BY timestamp DESC LIMIT 1""", (df_name,)).fetchone()
+
+    def save(self, df_name, df):
+        # Returns (file_path, file_format, base_path); base_path is set when the file only holds changes
+        storage = self.db.df_utils.storage
+        if not self.enabled() or storage.default_format() not in DELTA_FORMATS:
+            return self.db.df_utils.save_df(df) + (None,)
+        try:
+            hashes = row_hashes(df)
+        except TypeError:
+            # Cells such as lists or dicts cannot be hashed; such results are always stored whole
+            return self.db.df_utils.save_df(df) + (None,)
+
+        previous = self.previous(df_name)
+        base = read_rows(previous[0]) if previous and previous[1] in DELTA_FORMATS and os.path.exists(previous[0]) else None
+        if base is not None and len(base['hashes']) and schema(df) == (base['columns'], base['dtypes']):
+            import numpy as np
+            if np.array_equal(hashes, base['hashes']):
+                # Identical result: the new entry points at the file already on disk
+                return previous[0], previous[1], None
+            order = np.argsort(base['hashes'], kind='stable')
+            found_at = np.minimum(np.searchsorted(base['hashes'], hashes, sorter=order), len(order) - 1)
+            found = base['hashes'][order[found_at]] == hashes
+            added = ~found
+            row_bytes = base.get('row_bytes')
+            if row_bytes is None and not base['base']:
+                # Sidecars written before row_bytes was recorded; the base is a full file
+                row_bytes = os.path.getsize(previous[0]) / len(base['hashes'])
+            if base['depth'] < int(self.config.get("history_delta_chain")) and added.sum() <= len(df) // 2:
+                source = np.where(found, order[found_at], -np.cumsum(added))
+                file_path, file_format = self.db.df_utils.save_df(df[added])
+                if file_format in DELTA_FORMATS:
+                    write_rows(file_path, df, hashes, source, previous[0], previous[1], base['depth'] + 1, row_bytes)
+                    # The delta and its sidecar have to cost less than saving the result whole
+                    if row_bytes is None or os.path.getsize(file_path) + os.path.getsize(rows_path(file_path)) < row_bytes * len(df):
+                        return file_path, file_format, previous[0]
+                    os.unlink(rows_path(file_path))
+                if file_path and os.path.exists(file_path):
+                    os.unlink(file_path)
+
+        file_path, file_format = self.db.df_utils.save_df(df)
+        if file_format in DELTA_FORMATS and worth_tracking(file_path, len(df)):
+            write_rows(file_path, df, hashes, row_bytes=os.path.getsize(file_path) / len(df))
+        return file_path, file_format, None
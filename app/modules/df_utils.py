@@ -1,45 +1,124 @@
 import os
-import pandas as pd
+import json
+import hashlib
+import threading
 import subprocess
 from datetime import datetime
 from .config import Config
-from rgwfuncs import load_data_from_path
+from .storage import ResultStorage
 
 class DataFrameUtils:
+    # Content digest -> a CSV holding exactly that frame, written to history or by open()
+    _csv_files = {}
+    _csv_lock = threading.Lock()
+
     def __init__(self):
         self.config = Config()
+        self.storage = ResultStorage()
 
-    def save_df_to_csv(self, df):
+    def save_df(self, df, file_format=None):
+        import pandas as pd
         if not isinstance(df, pd.DataFrame):
-            return None
+            return None, None
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"{self.config.HISTORY_DIR}/{timestamp}.csv"
+        try:
+            file_path, file_format = self.storage.write(df, f"{self.config.HISTORY_DIR}/{timestamp}", file_format)
+        except Exception as e:
+            print(f"Error saving DataFrame: {str(e)}")
+            return None, None
+        if file_format == "csv":
+            # With history_format csv, open() can hand this file to the spreadsheet as it is
+            self.remember_csv(self.frame_digest(df), file_path)
+        return file_path, file_format
+
+    def frame_digest(self, df):
+        # None for frames whose cells (lists, dicts, ...) cannot be hashed
+        from .delta import row_hashes, schema
+        try:
+            hashes = row_hashes(df)
+        except TypeError:
+            return None
+        digest = hashlib.sha1(json.dumps(schema(df)).encode())
+        digest.update(hashes.tobytes())
+        return digest.hexdigest()[:20]
+
+    def remember_csv(self, digest, file_path):
+        if digest is not None:
+            with self._csv_lock:
+                self._csv_files[digest] = file_path
 
+    def known_csv(self, digest):
+        with self._csv_lock:
+            file_path = self._csv_files.get(digest) if digest is not None else None
+        # History files can be evicted in the meantime
+        return file_path if file_path and os.path.exists(file_path) else None
+
+    def csv_for_frame(self, df):
+        # An unchanged frame reuses the CSV already written for it, by history or an earlier open()
+        digest = self.frame_digest(df)
+        known = self.known_csv(digest)
+        if known:
+            return known, True
+        name = digest or datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        file_path = f"{self.config.HISTORY_DIR}/open_{name}.csv"
+        if digest is not None and os.path.exists(file_path):
+            self.remember_csv(digest, file_path)
+            return file_path, True
         try:
-            df.to_csv(filename, index=False)
-            return filename
+            df.to_csv(file_path + ".tmp", index=False)
+            os.replace(file_path + ".tmp", file_path)
+            self.remember_csv(digest, file_path)
+            return file_path, False
         except Exception as e:
             print(f"Error saving DataFrame to CSV: {str(e)}")
-            if os.path.exists(filename):
-                os.unlink(filename)
-            return None
+            if os.path.exists(file_path + ".tmp"):
+                os.unlink(file_path + ".tmp")
+            return None, False
+
+    def csv_for_file(self, source_path, file_format):
+        # A result already saved as CSV is opened where it is; other formats are converted once, chunk by chunk
+        if (file_format or self.storage.format_for_path(source_path)) == "csv":
+            return source_path, True
+        file_path = f"{self.config.HISTORY_DIR}/open_{os.path.splitext(os.path.basename(source_path))[0]}.csv"
+        if os.path.exists(file_path) and os.path.getmtime(file_path) >= os.path.getmtime(source_path):
+            return file_path, True
+        try:
+            with open(file_path + ".tmp", "w", newline="") as handle:
+                chunks = self.storage.iter_chunks(source_path, file_format, int(self.config.get("stream_chunk_rows")))
+                for i, chunk in enumerate(chunks):
+                    chunk.to_csv(handle, header=i == 0, index=False)
+            os.replace(file_path + ".tmp", file_path)
+            return file_path, False
+        except Exception as e:
+            print(f"Error saving DataFrame to CSV: {str(e)}")
+            if os.path.exists(file_path + ".tmp"):
+                os.unlink(file_path + ".tmp")
+            return None, False
 
     def open_df(self, df):
-        if not isinstance(df, pd.DataFrame):
+        import pandas as pd
+        from .streaming import SpilledResult
+        from .lazy import LazyFrame
+        if isinstance(df, LazyFrame) and df._df is not None:
+            df = df._df
+        if isinstance(df, SpilledResult):
+            file_path, reused = self.csv_for_file(df.file_path, df.file_format)
+        elif isinstance(df, pd.DataFrame):
+            file_path, reused = self.csv_for_frame(df)
+        else:
             print(f"Error: {df} is not a valid DataFrame")
             return
 
-        file_path = self.save_df_to_csv(df) if df is not None else None
         if file_path:
             try:
                 subprocess.Popen(['libreoffice', '--calc', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                print(f"Opened {file_path} in LibreOffice Calc")
+                print(f"Opened {file_path} in LibreOffice Calc{' (unchanged, not written again)' if reused else ''}")
                 return file_path
             except Exception as e:
                 print(f"Error opening DataFrame: {str(e)}")
         else:
             print("Failed to save or open the DataFrame")
 
-    def load_data_from_path(self, file_path):
-        return load_data_from_path(file_path)
+    def load_data_from_path(self, file_path, file_format=None):
+        return self.storage.read(file_path, file_format)
@@ -0,0 +1,115 @@
+import os
+import json
+import sqlite3
+import threading
+from .config import Config
+
+def _connect_mssql(preset):
+    import pymssql
+    return pymssql.connect(server=preset['host'], user=preset.get('user', preset.get('username')),
+                           password=preset['password'], database=preset.get('database', ''))
+
+def _connect_mysql(preset):
+    import mysql.connector
+    return mysql.connector.connect(host=preset['host'], user=preset.get('user', preset.get('username')),
+                                   password=preset['password'], database=preset.get('database', ''))
+
+def _connect_sqlite(preset):
+    return sqlite3.connect(os.path.expanduser(preset['db_path']), check_same_thread=False)
+
+def _cancel_mssql(preset, conn):
+    # pymssql exposes cancel() on the underlying _mssql connection
+    target = conn if hasattr(conn, 'cancel') else getattr(conn, '_conn', None)
+    return target.cancel if target is not None and hasattr(target, 'cancel') else None
+
+def _cancel_mysql(preset, conn):
+    connection_id = getattr(conn, 'connection_id', None)
+    if connection_id is None:
+        return None
+
+    def kill():
+        # A query can only be killed from a second connection
+        killer = _connect_mysql(preset)
+        try:
+            killer.cursor().execute(f"KILL QUERY {int(connection_id)}")
+        finally:
+            killer.close()
+    return kill
+
+def _cancel_sqlite(preset, conn):
+    return conn.interrupt
+
+class PresetDrivers:
+    CONNECTORS = {
+        'mssql': _connect_mssql,
+        'mysql': _connect_mysql,
+        'sqlite': _connect_sqlite,
+    }
+    CANCELLERS = {
+        'mssql': _cancel_mssql,
+        'mysql': _cancel_mysql,
+        'sqlite': _cancel_sqlite,
+    }
+    _presets = None
+    _presets_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = Config()
+
+    @classmethod
+    def _find_presets_file(cls):
+        # Same lookup as rgwfuncs: the current directory and then each parent
+        current_dir = os.getcwd()
+        while True:
+            presets_file = os.path.join(current_dir, '.rgwfuncsrc')
+            if os.path.isfile(presets_file):
+                return presets_file
+            parent_dir = os.path.dirname(current_dir)
+            if parent_dir == current_dir:
+                home_file = os.path.expanduser("~/.rgwfuncsrc")
+                return home_file if os.path.isfile(home_file) else None
+            current_dir = parent_dir
+
+    @classmethod
+    def _load_presets(cls):
+        # Worker threads look presets up concurrently; none may see a half-read file
+        with cls._presets_lock:
+            if cls._presets is None:
+                presets = {}
+                presets_file = cls._find_presets_file()
+                if presets_file:
+                    with open(presets_file, 'r') as f:
+                        for preset in json.load(f).get('db_presets', []):
+                            presets[preset['name']] = preset
+                cls._presets = presets
+        return cls._presets
+
+    def get_preset(self, preset_name):
+        preset = self._load_presets().get(preset_name)
+        if preset is None:
+            raise ValueError(f"Preset '{preset_name}' not found in .rgwfuncsrc")
+        return preset
+
+    def defined(self, preset_name):
+        return preset_name in self._load_presets()
+
+    def db_type(self, preset_name):
+        preset = self._load_presets().get(preset_name)
+        return preset.get('db_type') if preset else None
+
+    def supports(self, preset_name):
+        # Presets of other types (clickhouse, bigquery, athena, ...) only run through rgwfuncs
+        return self.db_type(preset_name) in self.CONNECTORS
+
+    def connect(self, preset_name):
+        preset = self.get_preset(preset_name)
+        connector = self.CONNECTORS.get(preset.get('db_type'))
+        if connector is None:
+            raise ValueError(f"Preset '{preset_name}' has db_type '{preset.get('db_type')}', which has no direct driver")
+        return connector(preset)
+
+    def canceller(self, preset_name, conn):
+        # A callable that stops the query running on conn from another thread, or None
+        preset = self.get_preset(preset_name)
+        cancel = self.CANCELLERS.get(preset.get('db_type'))
+        return cancel(preset, conn) if cancel else None
@@ -0,0 +1,146 @@
+import time
+import threading
+from .config import Config
+from .cancellation import Cancellation, activate
+
+class QueryJob:
+    def __init__(self, key, preset, fn, args=(), deps=(), timeout=None, on_timeout=None, on_start=None):
+        self.key = key
+        self.preset = preset
+        self.fn = fn
+        self.args = args
+        self.deps = list(deps)
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.on_start = on_start
+        self.cancellation = Cancellation(timeout)
+        self.timed_out = False
+        self.queued_at = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def wait_time(self):
+        if self.queued_at is None or self.started_at is None:
+            return 0.0
+        return self.started_at - self.queued_at
+
+    @property
+    def run_time(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+class QueryExecutor:
+    def __init__(self):
+        self.config = Config()
+
+    def max_workers(self):
+        return max(1, int(self.config.get("max_workers")))
+
+    def preset_limit(self, preset):
+        limits = self.config.get("preset_max_workers") or {}
+        limit = limits.get(preset, self.config.get("default_preset_max_workers"))
+        return max(1, int(limit)) if limit else self.max_workers()
+
+    def run(self, jobs, run_timeout=None):
+        pending = list(jobs)
+        running = {}
+        active = []
+        unfinished = set(job.key for job in pending)
+        cond = threading.Condition()
+
+        queued_at = time.time()
+        run_deadline = queued_at + run_timeout if run_timeout else None
+        for job in pending:
+            job.queued_at = queued_at
+
+        def next_job():
+            # First queued job whose inputs are done and whose preset still has a free
+            # slot, so one saturated preset never holds up queries aimed at another
+            for job in pending:
+                if unfinished.intersection(job.deps):
+                    continue
+                if running.get(job.preset, 0) < self.preset_limit(job.preset):
+                    return job
+            return None
+
+        def worker():
+            while True:
+                with cond:
+                    job = None
+                    while job is None:
+                        if not pending:
+                            return
+                        job = next_job()
+                        if job is None:
+                            cond.wait()
+                    pending.remove(job)
+                    running[job.preset] = running.get(job.preset, 0) + 1
+                    active.append(job)
+                    job.started_at = time.time()
+                activate(job.cancellation)
+                try:
+                    if job.on_start:
+                        job.on_start(job)
+                    job.fn(*job.args)
+                finally:
+                    with cond:
+                        if job.timed_out:
+                            # Written off by the watchdog, which started a replacement worker
+                            return
+                        job.finished_at = time.time()
+                        running[job.preset] -= 1
+                        active.remove(job)
+                        unfinished.discard(job.key)
+                        cond.notify_all()
+
+        def start_worker():
+            # Daemon threads, so a query that ignores cancellation cannot keep the process alive
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+
+        def expire(job, now):
+            job.timed_out = True
+            job.finished_at = now
+            if job in active:
+                running[job.preset] -= 1
+                active.remove(job)
+            else:
+                pending.remove(job)
+            unfinished.discard(job.key)
+            return job
+
+        for _ in range(min(self.max_workers(), len(pending))):
+            start_worker()
+
+        # Threads cannot be stopped, so instead of joining the workers this thread
+        # enforces deadlines and hands timed-out jobs back to their owners
+        with cond:
+            while unfinished:
+                now = time.time()
+                expired = [expire(job, now) for job in list(active)
+                           if job.timeout and now - job.started_at >= job.timeout]
+                if run_deadline and now >= run_deadline:
+                    expired.extend(expire(job, now) for job in list(active) + list(pending))
+                if expired:
+                    # Results are recorded before dependents can be scheduled again
+                    for job in expired:
+                        if job.on_timeout:
+                            job.on_timeout(job)
+                        if pending:
+                            start_worker()
+                    cond.notify_all()
+                    # Cancelling may mean a round trip to the server, so not under the lock
+                    cond.release()
+                    try:
+                        for job in expired:
+                            job.cancellation.cancel()
+                    finally:
+                        cond.acquire()
+                    continue
+                deadlines = [job.started_at + job.timeout for job in active if job.timeout]
+                if run_deadline:
+                    deadlines.append(run_deadline)
+                cond.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+        return jobs
@@ -0,0 +1,118 @@
+import os
+import bz2
+import gzip
+import lzma
+import time
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .config import Config
+from .storage import ResultStorage
+from .profiling import format_bytes
+
+EXPORT_FORMATS = ("csv", "parquet", "feather")
+# compression -> (suffix, opener) for CSV exports; Parquet and Feather take the codec name instead
+CSV_COMPRESSION = {None: ("", open), "gzip": (".gz", gzip.open), "bz2": (".bz2", bz2.open), "xz": (".xz", lzma.open)}
+
+def export_frame(source, file_path, file_format, compression, chunk_rows):
+    # Runs in a worker process. source is a DataFrame, or (file_path, file_format) of a
+    # result on disk, which is copied chunk by chunk so it never has to fit in memory
+    storage = ResultStorage()
+    if isinstance(source, tuple):
+        chunks = storage.iter_chunks(source[0], source[1], chunk_rows)
+    else:
+        chunks = [source]
+    tmp_path = file_path + ".tmp"
+    rows = 0
+    try:
+        if file_format == "csv":
+            with CSV_COMPRESSION[compression][1](tmp_path, "wt", newline="") as handle:
+                for chunk in chunks:
+                    chunk.to_csv(handle, header=rows == 0, index=False)
+                    rows += len(chunk)
+        else:
+            writer = ResultStorage.FORMATS[file_format][3](tmp_path, file_format, compression)
+            for chunk in chunks:
+                writer.write(chunk)
+            if writer.row_count == 0 and isinstance(source, tuple):
+                # An empty file yields no chunks; write its columns at least
+                writer.write(storage.read(source[0], source[1]))
+            writer.close()
+            rows = writer.row_count
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return rows, os.path.getsize(file_path)
+
+class Exporter:
+    def __init__(self):
+        self.config = Config()
+        self.storage = ResultStorage()
+
+    def frames(self, namespace):
+        import pandas as pd
+        from .streaming import SpilledResult
+        from .lazy import LazyFrame
+        sources = {}
+        for name, value in namespace.items():
+            if name.startswith('_'):
+                continue
+            if isinstance(value, LazyFrame) and value._df is not None:
+                value = value._df
+            if isinstance(value, SpilledResult):
+                sources[name] = (value.file_path, value.file_format)
+            elif isinstance(value, pd.DataFrame):
+                sources[name] = value
+        return sources
+
+    def export_all(self, namespace, file_format="csv", dest=None, compression=None, workers=None):
+        if file_format not in EXPORT_FORMATS:
+            print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Unknown export format '{file_format}', expected one of {', '.join(EXPORT_FORMATS)}{self.config.RESET_COLOR}")
+            return None
+        if file_format == "csv" and compression not in CSV_COMPRESSION:
+            print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Unknown CSV compression '{compression}', expected one of {', '.join(c for c in CSV_COMPRESSION if c)}{self.config.RESET_COLOR}")
+            return None
+        if file_format != "csv" and compression is None:
+            compression = self.config.get("history_compression")
+        sources = self.frames(namespace)
+        if not sources:
+            print(f"{self.config.HEADING_COLOR}Export:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No DataFrames to export.{self.config.RESET_COLOR}")
+            return None
+
+        dest = os.path.expanduser(dest or f"~/Downloads/datasling_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(dest, exist_ok=True)
+        suffix = self.storage.extension(file_format) + (CSV_COMPRESSION[compression][0] if file_format == "csv" else "")
+        chunk_rows = int(self.config.get("stream_chunk_rows"))
+        workers = int(workers or self.config.get("export_workers") or os.cpu_count() or 1)
+        print(f"{self.config.HEADING_COLOR}Exporting {len(sources)} DataFrame(s) to {dest} as {file_format}"
+              f"{f' ({compression})' if compression else ''}:{self.config.RESET_COLOR}")
+
+        start = time.time()
+        written, total = [], 0
+        # CSV and Parquet encoding hold the GIL, so frames are written in separate processes.
+        # Spawned, not forked: forking while writer and pool threads hold locks can deadlock the child
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(sources))), mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {}
+            # Largest first, so the longest export is not the one left running at the end
+            for name in sorted(sources, key=lambda n: -self.size_of(sources[n])):
+                futures[pool.submit(export_frame, sources[name], os.path.join(dest, name + suffix), file_format, compression, chunk_rows)] = name
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    rows, size = future.result()
+                except Exception as e:
+                    print(f"{self.config.HEADING_COLOR}Error exporting {name}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+                    continue
+                written.append(os.path.join(dest, name + suffix))
+                total += size
+                print(f"{self.config.CONTENT_COLOR}  {name + suffix}: {rows} rows, {format_bytes(size)}{self.config.RESET_COLOR}")
+        print(f"{self.config.HEADING_COLOR}Exported {len(written)} of {len(sources)} DataFrame(s), {format_bytes(total)} in {time.time() - start:.2f}s{self.config.RESET_COLOR}")
+        print()
+        return dest
+
+    def size_of(self, source):
+        if isinstance(source, tuple):
+            return os.path.getsize(source[0]) if os.path.exists(source[0]) else 0
+        return int(source.memory_usage(deep=False).sum())
@@ -1,10 +1,21 @@
 import os
 import re
 import sys
+import hashlib
 import builtins
 from .config import Config
 
+DIRECTIVE_RE = re.compile(r'(\w+)@preset::(\w+)((?:@\w+::[^@\s]+)*)')
+MULTILINE_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+OPTION_RE = re.compile(r'@(\w+)::([^@\s]+)')
+# String literals are kept verbatim; runs of whitespace and -- comments collapse to one space
+NORMALIZE_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|((?:--[^\n]*|\s)+)")
+# Directive options that change which rows a query returns, or how they are stored
+RESULT_OPTIONS = ('partition', 'parts', 'compact')
+
 class FileUtils:
+    _manifest_cache = {}
+
     def __init__(self):
         self.config = Config()
 
@@ -34,7 +45,7 @@ class FileUtils:
 
         for filepath in filepaths:
             queries = self.collect_queries(filepath)
-            for df_name, preset, query in queries:
+            for df_name, preset, query, options in queries:
                 if df_name in all_queries:
                     if filepath not in conflicts:
                         conflicts[filepath] = set()
@@ -46,52 +57,90 @@ class FileUtils:
 
         return conflicts
 
+    def collect_manifest(self, filepaths):
+        manifest = []
+        for filepath in filepaths:
+            manifest.extend(self.collect_queries(filepath))
+        return manifest
+
     def collect_queries(self, filepath):
-        with builtins.open(filepath, 'r') as f:
-            content = f.read()
+        queries = self.parse_file(filepath)
+
+        if not queries:
+            print(f"{self.config.CONTENT_COLOR}Error: No valid SQL queries found in {filepath}.{self.config.RESET_COLOR}")
+            sys.exit(1)
 
-        content = self._remove_multiline_comments(content)
-        lines = content.splitlines()
+        return list(queries)
+
+    def parse_file(self, filepath):
+        # Parsed files are reused until their mtime or size changes, so the conflict
+        # check, the run and historic() only pay for parsing once
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        cached = FileUtils._manifest_cache.get(path)
+        if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+            return cached[1]
+
+        with builtins.open(filepath, 'r') as f:
+            content = MULTILINE_COMMENT_RE.sub('', f.read())
 
         queries = []
-        current_query = []
-        current_df_name = None
-        current_preset = None
+        lines = []
+        has_code = False
+        df_name = preset = None
+        options = {}
 
-        for line in lines:
+        for line in content.splitlines():
             line = line.rstrip()
             if not line or line.startswith("--"):
-                if current_query and current_df_name and current_preset:
-                    query_text = "\n".join(current_query).strip()
-                    if query_text and not all(q.strip().startswith("--") or not q.strip() for q in current_query):
-                        queries.append((current_df_name, current_preset, query_text))
-                    current_query = []
-                    current_df_name = None
-                    current_preset = None
+                if lines and df_name:
+                    if has_code:
+                        queries.append((df_name, preset, "\n".join(lines).strip(), options))
+                    lines = []
+                    has_code = False
+                    df_name = preset = None
+                    options = {}
                 continue
 
-            directive_match = re.match(r'(\w+)@preset::(\w+)', line)
+            directive_match = DIRECTIVE_RE.match(line)
             if directive_match:
-                if current_query and current_df_name and current_preset:
-                    query_text = "\n".join(current_query).strip()
-                    if query_text and not all(q.strip().startswith("--") or not q.strip() for q in current_query):
-                        queries.append((current_df_name, current_preset, query_text))
-                    current_query = []
-                current_df_name = directive_match.group(1)
-                current_preset = directive_match.group(2)
-            elif current_df_name and current_preset:
-                current_query.append(line)
-
-        if current_query and current_df_name and current_preset:
-            query_text = "\n".join(current_query).strip()
-            if query_text and not all(q.strip().startswith("--") or not q.strip() for q in current_query):
-                queries.append((current_df_name, current_preset, query_text))
+                if lines and df_name:
+                    if has_code:
+                        queries.append((df_name, preset, "\n".join(lines).strip(), options))
+                    lines = []
+                    has_code = False
+                df_name, preset, option_text = directive_match.groups()
+                options = dict(OPTION_RE.findall(option_text)) if option_text else {}
+            elif df_name:
+                lines.append(line)
+                if not has_code and not line.lstrip().startswith("--"):
+                    has_code = True
 
-        if not queries:
-            print(f"{self.config.CONTENT_COLOR}Error: No valid SQL queries found in {filepath}.{self.config.RESET_COLOR}")
-            sys.exit(1)
+        if lines and df_name and has_code:
+            queries.append((df_name, preset, "\n".join(lines).strip(), options))
 
+        queries = tuple(queries)
+        FileUtils._manifest_cache[path] = ((stat.st_mtime_ns, stat.st_size), queries)
         return queries
 
-    def _remove_multiline_comments(self, content):
-        return re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
+    def normalize_query(self, query):
+        def replace(match):
+            return match.group(1) if match.group(1) else ' '
+        return NORMALIZE_RE.sub(replace, query).strip().rstrip(';').strip()
+
+    def result_options(self, options):
+        # Options that change the result; a partitioned result is not the whole query's result,
+        # and a compacted one has other dtypes. --compact counts the same as @compact::true
+        options = dict(options or {})
+        compact = options.get('compact', self.config.get("compact"))
+        options['compact'] = 'true' if str(compact).lower() in ('1', 'true', 'yes') else None
+        shaping = sorted((k, str(v)) for k, v in options.items() if k in RESULT_OPTIONS and v is not None)
+        return f"\n{shaping}" if shaping else ""
+
+    def query_hash(self, preset, query, options=None):
+        key = f"{preset}\n{self.normalize_query(query)}{self.result_options(options)}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def directive_fingerprint(self, df_name, preset, query, options=None):
+        key = f"{df_name}\n{preset}\n{self.normalize_query(query)}{self.result_options(options)}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
@@ -1,47 +1,207 @@
-import sqlite3
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from .config import Config
 from .df_utils import DataFrameUtils
 from .file_utils import FileUtils
+from .db import Database
+from .lazy import LazyFrame
+from .streaming import SpilledResult
+from .delta import read_rows, row_hashes
 
 class HistoryManager:
     def __init__(self):
         self.config = Config()
         self.df_utils = DataFrameUtils()
         self.file_utils = FileUtils()
+        self.db = Database()
+        # Names whose shell value was reloaded from history rather than fetched in this session
+        self.reloaded = set()
 
-    def get_historic_df(self, df_name):
-        conn = sqlite3.connect(self.config.HISTORY_DB)
-        c = conn.cursor()
-        c.execute("""
-            SELECT file_path, preset, query, timestamp
-            FROM query_history
-            WHERE df_name = ? AND file_path IS NOT NULL
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """, (df_name,))
-        row = c.fetchone()
-        conn.close()
+    def get_historic_entries(self, df_names):
+        names = list(dict.fromkeys(df_names))
+        entries = {}
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            with self.db.connection.cursor() as c:
+                # SQLite takes the bare columns from the row holding MAX(timestamp)
+                c.execute(f"""
+                    SELECT df_name, file_path, file_format, preset, query, MAX(timestamp), printed_output, row_count, col_count
+                    FROM query_history
+                    WHERE df_name IN ({placeholders}) AND file_path IS NOT NULL
+                    GROUP BY df_name
+                """, chunk)
+                for df_name, *entry in c.fetchall():
+                    entries[df_name] = tuple(entry)
+        return entries
+
+    def load_historic(self, df_names, lazy=False, namespace=None):
+        entries = {name: entry for name, entry in self.get_historic_entries(df_names).items() if os.path.exists(entry[0])}
+        loaded = {}
+        if not entries:
+            return loaded
+        # Attaching counts as a use, so retention keeps what the shell is working with
+        self.db.touch([entry[0] for entry in entries.values()])
+
+        if lazy:
+            # Shape and preview come from query_history; files are only read on first use
+            for df_name, (file_path, file_format, preset, query, timestamp, preview, row_count, col_count) in entries.items():
+                loaded[df_name] = (LazyFrame(df_name, file_path, file_format, row_count, col_count, preview, timestamp, self.df_utils, namespace),
+                                   preset, query, timestamp)
+            print(f"{self.config.HEADING_COLOR}Attached {len(loaded)} historic DataFrame(s) lazily; each loads on first use.{self.config.RESET_COLOR}")
+            print()
+            return loaded
+
+        def load(file_path, file_format):
+            start = time.time()
+            return self.df_utils.load_data_from_path(file_path, file_format), time.time() - start
+
+        workers = min(max(1, int(self.config.get("history_readers"))), len(entries))
+        print(f"{self.config.HEADING_COLOR}Loading {len(entries)} historic DataFrame(s) on {workers} thread(s):{self.config.RESET_COLOR}")
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="history-reader") as pool:
+            # Biggest files first, so the total is bounded by the largest frame rather than by bad luck in ordering
+            futures = {pool.submit(load, entry[0], entry[1]): name
+                       for name, entry in sorted(entries.items(), key=lambda item: os.path.getsize(item[1][0]), reverse=True)}
+            for done, future in enumerate(as_completed(futures), 1):
+                df_name = futures[future]
+                preset, query, timestamp = entries[df_name][2:5]
+                try:
+                    df, elapsed = future.result()
+                except Exception as e:
+                    print(f"{self.config.HEADING_COLOR}  [{done}/{len(entries)}] Error loading {df_name}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+                    continue
+                loaded[df_name] = (df, preset, query, timestamp)
+                print(f"{self.config.CONTENT_COLOR}  [{done}/{len(entries)}] {df_name}: {len(df)} rows in {elapsed:.2f}s{self.config.RESET_COLOR}")
+        print(f"{self.config.CONTENT_COLOR}  Loaded {len(loaded)} of {len(entries)} in {time.time() - start:.2f}s{self.config.RESET_COLOR}")
+        print()
+        return loaded
+
+    def get_cached_df(self, query_hash, since, spill_as=None):
+        # With spill_as, the result stays on disk and comes back as a SpilledResult of that name,
+        # so a streamed directive served from history is held to the memory budget like a fetched one
+        with self.db.connection.cursor() as c:
+            c.execute("""
+                SELECT file_path, file_format, timestamp, row_count, printed_output
+                FROM query_history
+                WHERE query_hash = ? AND file_path IS NOT NULL AND timestamp >= ?
+                ORDER BY timestamp DESC
+                LIMIT 1
+            """, (query_hash, since))
+            row = c.fetchone()
 
         if row:
-            file_path, preset, query, timestamp = row
+            file_path, file_format, timestamp, row_count, preview = row
             if os.path.exists(file_path):
-                return self.df_utils.load_data_from_path(file_path), preset, query, timestamp
-        return None, None, None, None
+                self.db.touch([file_path])
+                if spill_as is not None:
+                    return self.spilled(spill_as, file_path, file_format, row_count, preview), timestamp
+                return self.df_utils.load_data_from_path(file_path, file_format), timestamp
+        return None, None
+
+    def spilled(self, df_name, file_path, file_format, row_count, preview):
+        # Only the first chunk is read, for the column names; the row count is only
+        # counted chunk by chunk for entries saved before it was recorded
+        chunk_rows = int(self.config.get("stream_chunk_rows"))
+        columns, counted = None, 0
+        for chunk in self.df_utils.storage.iter_chunks(file_path, file_format, chunk_rows):
+            if columns is None:
+                columns = list(chunk.columns)
+            counted += len(chunk)
+            if row_count is not None:
+                break
+        return SpilledResult(df_name, file_path, file_format, counted if row_count is None else row_count, columns or [], preview, self.df_utils)
+
+    def get_last_fingerprints(self, df_names):
+        if not df_names:
+            return {}
+        placeholders = ','.join('?' for _ in df_names)
+        with self.db.connection.cursor() as c:
+            # SQLite takes the bare columns from the row holding MAX(timestamp).
+            # Historic reloads fetched nothing, so only runs that queried the source count
+            c.execute(f"""
+                SELECT df_name, fingerprint, status, MAX(timestamp)
+                FROM query_history
+                WHERE df_name IN ({placeholders}) AND status IS NOT 'historic'
+                GROUP BY df_name
+            """, list(df_names))
+            rows = c.fetchall()
+        return {df_name: (fingerprint, status) for df_name, fingerprint, status, _ in rows}
+
+    def version_hashes(self, file_path, file_format):
+        rows = read_rows(file_path)
+        if rows is not None:
+            return rows['hashes'], rows
+        # Saved before row hashes were kept, or in a format without them
+        return row_hashes(self.df_utils.load_data_from_path(file_path, file_format)), None
+
+    def diff(self, df_name, n=10):
+        import numpy as np
+        with self.db.connection.cursor() as c:
+            rows = c.execute("""
+                SELECT file_path, file_format, timestamp
+                FROM query_history
+                WHERE df_name = ? AND file_path IS NOT NULL
+                ORDER BY timestamp DESC
+                LIMIT 2
+            """, (df_name,)).fetchall()
+        rows = [row for row in rows if os.path.exists(row[0])]
+        if len(rows) < 2:
+            print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{df_name} needs two saved versions to diff{self.config.RESET_COLOR}")
+            return
+        (new_path, new_format, new_timestamp), (old_path, old_format, old_timestamp) = rows
+        print(f"{self.config.HEADING_COLOR}Changes to {df_name} from {old_timestamp} to {new_timestamp}:{self.config.RESET_COLOR}")
+        if new_path == old_path:
+            print(f"{self.config.CONTENT_COLOR}  No changes; both runs returned the same rows{self.config.RESET_COLOR}")
+            print()
+            return
+
+        try:
+            new_hashes, new_rows = self.version_hashes(new_path, new_format)
+            old_hashes, old_rows = self.version_hashes(old_path, old_format)
+        except TypeError as e:
+            print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Cannot compare rows of {df_name}: {str(e)}{self.config.RESET_COLOR}")
+            return
+        added = ~np.isin(new_hashes, old_hashes)
+        removed = ~np.isin(old_hashes, new_hashes)
+        if new_rows is not None and old_rows is not None and new_rows['columns'] != old_rows['columns']:
+            gained = [column for column in new_rows['columns'] if column not in old_rows['columns']]
+            lost = [column for column in old_rows['columns'] if column not in new_rows['columns']]
+            print(f"{self.config.CONTENT_COLOR}  Columns changed: added {gained or 'none'}, removed {lost or 'none'}{self.config.RESET_COLOR}")
+        print(f"{self.config.CONTENT_COLOR}  Rows: {len(old_hashes)} -> {len(new_hashes)}  |  new or changed: {int(added.sum())}  |  "
+              f"gone or changed: {int(removed.sum())}  |  unchanged: {int((~added).sum())}{self.config.RESET_COLOR}")
+
+        if added.any():
+            if new_rows is not None and new_rows.get('base') == old_path:
+                # A delta against the previous version holds exactly the new rows
+                new_df = self.df_utils.storage.read(new_path, new_format, resolve=False)
+            else:
+                new_df = self.df_utils.load_data_from_path(new_path, new_format)[added]
+            print(f"{self.config.HEADING_COLOR}  New or changed rows (first {n}):{self.config.RESET_COLOR}")
+            print(f"{self.config.CONTENT_COLOR}{new_df.head(n)}{self.config.RESET_COLOR}")
+        if removed.any():
+            old_df = self.df_utils.load_data_from_path(old_path, old_format)[removed]
+            print(f"{self.config.HEADING_COLOR}  Rows no longer returned (first {n}):{self.config.RESET_COLOR}")
+            print(f"{self.config.CONTENT_COLOR}{old_df.head(n)}{self.config.RESET_COLOR}")
+        print()
 
-    def historic(self, df_names=None, global_namespace=None):
+    def historic(self, df_names=None, global_namespace=None, lazy=None):
+        if lazy is None:
+            lazy = self.config.get("lazy_load")
         if global_namespace is None:
             global_namespace = globals()
         if df_names is None:
-            all_queries = []
-            for filepath in global_namespace.get('ORIGINAL_FILEPATHS', []):
-                all_queries.extend(self.file_utils.collect_queries(filepath))
+            all_queries = self.file_utils.collect_manifest(global_namespace.get('ORIGINAL_FILEPATHS', []))
             df_names = [q[0] for q in all_queries]
 
+        loaded = self.load_historic(df_names, lazy, global_namespace)
         for df_name in df_names:
-            df, preset, query, timestamp = self.get_historic_df(df_name)
+            df, preset, query, timestamp = loaded.get(df_name, (None, None, None, None))
             if df is not None:
                 global_namespace[df_name] = df
+                self.reloaded.add(df_name)
                 print(f"{self.config.HEADING_COLOR}Reloaded historic {df_name} (preset: {preset}, timestamp: {timestamp}):{self.config.RESET_COLOR}")
                 print(f"{self.config.CONTENT_COLOR}{df}{self.config.RESET_COLOR}")
                 print()
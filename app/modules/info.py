@@ -52,9 +52,32 @@ directive to define DataFrame name and preset.
     df2@preset::snowflake
     SELECT * FROM table2 WHERE date > '2023-01-01'
 
+Directives take optional '@option::value' suffixes, e.g.
+'df3@preset::redshift@ttl::30m' reuses a cached result of that
+query for up to 30 minutes, and '@timeout::5m' cancels a query that
+runs longer than 5 minutes.
+
+Directives can build on each other: '{{{{df1.col}}}}' in a query expands
+to the distinct values of df1.col, '@depends::df1,df2' declares inputs,
+and the 'pandas' preset evaluates a pandas expression over other
+DataFrames, e.g.
+
+    report@preset::pandas
+    df1.merge(df2, on="id")
+
+The 'local' preset does the same in SQL, on this machine:
+
+    totals@preset::local
+    SELECT id, COUNT(*) AS n FROM df1 GROUP BY id
+
 {self.config.HEADING_COLOR}Quickstart/ Step III{self.config.RESET_COLOR}
 {self.config.CONTENT_COLOR}Invoke datasling with optional file/directory arguments and flags:
-    datasling [--historic] [<sql_file_or_directory>...]
+    datasling [--historic] [--fast] [--max-workers=N]
+              [--preset-workers=preset:N,...]
+              [--history-format=parquet|feather|csv] [--cache=TTL]
+              [--stream] [--memory-budget=MB] [--compact] [--lazy]
+              [--progressive] [--timeout=T] [--run-timeout=T]
+              [<sql_file_or_directory>...]
 
     Examples:
     datasling                     # Process all .sql files in
@@ -65,17 +88,48 @@ directive to define DataFrame name and preset.
                                   # for all .sql files in current directory
     datasling --historic q.sql    # Use most recent historic data for
                                   # specified file
+    datasling --historic --lazy   # Show saved shapes and previews at
+                                  # once, load each frame on first use
+    datasling --progressive       # Open the shell at once; frames
+                                  # appear as their queries finish
+    datasling --fast              # Skip banner animation and delays
+                                  # (or set DATASLING_FAST=1)
+    datasling --max-workers=4 --preset-workers=redshift:2
+                                  # Cap concurrent queries overall
+                                  # and per preset
 
 {self.config.HEADING_COLOR}Explore Utilities{self.config.RESET_COLOR}
 {self.config.CONTENT_COLOR}The following utilities are available in the interactive shell:
 
-- open(df_name): Open DataFrame in LibreOffice Calc
+- open(df_name): Open DataFrame in LibreOffice Calc; an unchanged
+  DataFrame reuses the CSV written last time
+- export_all(format="csv", dest=None, compression=None): Write every
+  DataFrame in the shell to a directory in parallel processes
 - history(n): Show last n query history entries. Defaults to 10.
 - clear_history(): Clear all query history
-- run(): Re-run all original SQL files (respects --historic flag
-  from initial run)
+- diff("df_name"): Show rows that are new, changed or gone since
+  the previous run of df_name
+- pin("df_name"): Keep the latest saved result of df_name out of
+  eviction; pin() lists pinned results
+- unpin("df_name"): Let a pinned result be evicted again
+- run(): Re-run directives from the original SQL files that changed
+  or failed since their last successful run
+- run(force=True): Re-run every directive
 - historic(["df1","df2"]): Reload all (if no args) or specified
   DataFrames from history
+- historic(lazy=True): Attach lazy proxies that load on first use
+- pending_writes(): Show results still being saved to history in the
+  background
+- stats(n): Rank the n most expensive queries (default 10) with their
+  queue, connect, execute, fetch, build and persist times, rows, size,
+  estimated memory and how their cost moved over recent runs
+- sql("SELECT ... FROM df1 JOIN df2 ..."): Run SQL over the
+  DataFrames in the shell with an in-memory SQLite database
+- pool(): Show pooled database connections and the setup time
+  they saved
+- status(): Show which directives are queued, running or finished
+- wait("df_name"): Block until a directive finishes and return it;
+  wait() waits for the whole run
 - info(): Show this documentation
 
 {self.config.HEADING_COLOR}Tips{self.config.RESET_COLOR}
@@ -91,6 +145,28 @@ directive to define DataFrame name and preset.
 - Use comments (--) to organize your SQL files
 - Check history() for past query results
 - Use open() to explore large DataFrames externally
-- History is limited to last 40 entries (older entries auto-deleted){self.config.RESET_COLOR}
+- Saved results are kept within 10 GB and 90 days, least recently
+  used first out (history_max_mb and history_max_age in
+  ~/.dataslingrc); pin("df_name") keeps a result regardless
+- Concurrency limits can also be set in ~/.dataslingrc
+  (max_workers, default_preset_max_workers, preset_max_workers)
+- Use --cache=1h (or cache_ttl in ~/.dataslingrc) to serve
+  unchanged queries from history; cached results are marked CACHED
+- Use --stream (or '@stream::true' on a directive) to write big
+  results to disk in chunks under a memory budget; materialize a
+  streamed result with df = df.load()
+- Use --compact (or '@compact::true' on a directive) to shrink
+  fetched DataFrames with smaller dtypes, categoricals and dates
+- Use --timeout=5m (or '@timeout::5m' on a directive) to cancel
+  runaway queries; the other results still load
+- Add '@partition::id:0..1000000@parts::4' (or a value list such as
+  '@partition::region:north,south') to split a big query into
+  parallel ones that are combined into one DataFrame; put
+  '{{{{partition}}}}' in the query to place the filter yourself
+- Directives with the same preset and SQL run once per run and share
+  the result; a second session waits for a query already running in
+  another one (session_leases in ~/.dataslingrc)
+- History results are saved as compressed Parquet by default,
+  keeping dtypes; set history_format in ~/.dataslingrc to change it{self.config.RESET_COLOR}
 """
         print(instructions)
@@ -0,0 +1,56 @@
+import threading
+from .streaming import SpilledResult
+
+class LazyFrame(SpilledResult):
+    def __init__(self, df_name, file_path, file_format, row_count, col_count, preview, timestamp, df_utils, namespace=None):
+        # columns is left to the DataFrame; the proxy only knows how many there are
+        self.df_name = df_name
+        self.file_path = file_path
+        self.file_format = file_format
+        self.row_count = row_count
+        self.col_count = col_count
+        self.preview = preview
+        self.timestamp = timestamp
+        self.df_utils = df_utils
+        self.namespace = namespace
+        self._df = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._df is None:
+                self._df = super().load()
+                # From now on the name refers to the DataFrame itself
+                if self.namespace is not None and self.namespace.get(self.df_name) is self:
+                    self.namespace[self.df_name] = self._df
+        return self._df
+
+    def __getattr__(self, name):
+        # Only reached for attributes the proxy does not have itself
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        if self._df is not None:
+            return repr(self._df)
+        rows = self.row_count if self.row_count is not None else "?"
+        cols = self.col_count if self.col_count is not None else "?"
+        preview = self.preview.rstrip() if self.preview else "(no preview saved)"
+        return f"{preview}\n\n[{rows} rows x {cols} columns from {self.timestamp}; loads on first use]"
+
+def _delegate(name):
+    def method(self, *args, **kwargs):
+        args = [arg.load() if isinstance(arg, LazyFrame) else arg for arg in args]
+        return getattr(self.load(), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+# Operators are looked up on the type, so __getattr__ alone does not cover them
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__len__', '__iter__', '__contains__', '__array__',
+              '__eq__', '__ne__', '__lt__', '__le__', '__gt__', '__ge__',
+              '__add__', '__sub__', '__mul__', '__truediv__', '__floordiv__', '__mod__', '__pow__',
+              '__radd__', '__rsub__', '__rmul__', '__rtruediv__', '__rfloordiv__', '__rmod__', '__rpow__',
+              '__and__', '__or__', '__xor__', '__invert__', '__neg__', '__abs__'):
+    setattr(LazyFrame, _name, _delegate(_name))
+LazyFrame.__hash__ = None
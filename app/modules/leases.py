@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+import time
+import socket
+import threading
+from .config import Config
+
+class QueryLeases:
+    def __init__(self):
+        self.config = Config()
+        self.lease_dir = os.path.join(self.config.HISTORY_DIR, "leases")
+        os.makedirs(self.lease_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.held = set()
+
+    def enabled(self):
+        return bool(self.config.get("session_leases"))
+
+    def key(self, query_hash, options):
+        # Options such as @compact:: change the result, so each combination has its own lease
+        extra = sorted((k, str(v)) for k, v in options.items() if k != 'ttl')
+        return hashlib.sha256(f"{query_hash}\n{extra}".encode('utf-8')).hexdigest() if extra else query_hash
+
+    def holds(self, query_hash):
+        with self.lock:
+            return query_hash in self.held
+
+    def path(self, query_hash):
+        return os.path.join(self.lease_dir, f"{query_hash}.lease")
+
+    def try_acquire(self, query_hash):
+        path = self.path(query_hash)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.is_stale(query_hash):
+                return False
+            # The holder died or gave up long ago; take over its lease
+            self._remove(path)
+            return self.try_acquire(query_hash)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'pid': os.getpid(), 'host': socket.gethostname(), 'started': time.time()}, f)
+        with self.lock:
+            self.held.add(query_hash)
+        return True
+
+    def holder(self, query_hash):
+        try:
+            with open(self.path(query_hash), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Gone already, or its holder is still writing it
+            return None
+
+    def is_stale(self, query_hash):
+        holder = self.holder(query_hash)
+        if holder is None:
+            try:
+                # A lease that stays unreadable was left half-written
+                return time.time() - os.path.getmtime(self.path(query_hash)) > 5
+            except OSError:
+                return True
+        if time.time() - holder.get('started', 0) > float(self.config.get("lease_timeout")):
+            return True
+        if holder.get('host') == socket.gethostname():
+            try:
+                os.kill(holder['pid'], 0)
+            except ProcessLookupError:
+                return True
+            except (OSError, KeyError):
+                pass
+        return False
+
+    def wait(self, query_hash):
+        while os.path.exists(self.path(query_hash)) and not self.is_stale(query_hash):
+            time.sleep(0.5)
+
+    def release(self, query_hashes):
+        for query_hash in query_hashes:
+            with self.lock:
+                if query_hash not in self.held:
+                    continue
+                self.held.discard(query_hash)
+            self._remove(self.path(query_hash))
+
+    def take_held(self):
+        with self.lock:
+            return set(self.held)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,62 @@
+import sqlite3
+import weakref
+import threading
+from .config import Config
+from .dag import NAME_RE
+from .streaming import SpilledResult
+from .lazy import LazyFrame
+
+class LocalSQL:
+    def __init__(self, df_utils):
+        self.config = Config()
+        self.df_utils = df_utils
+        # One in-memory database per session, so tables loaded for one query serve the next
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.lock = threading.Lock()
+        # table name -> (weak reference to the frame it was loaded from, its content signature)
+        self.tables = {}
+
+    def is_frame(self, value):
+        import pandas as pd
+        return isinstance(value, (pd.DataFrame, SpilledResult))
+
+    def query(self, sql, frames):
+        import pandas as pd
+        with self.lock:
+            # Only frames the query mentions are copied in, and only when they changed since the last copy
+            for name in sorted(set(NAME_RE.findall(sql))):
+                frame = frames.get(name)
+                if self.is_frame(frame):
+                    self.load_table(name, frame)
+            return pd.read_sql_query(sql, self.connection)
+
+    def signature(self, frame):
+        # Frames can be edited in place, so identity alone does not tell whether a table is current.
+        # Results on disk never change; a frame whose cells cannot be hashed is always copied again
+        from .delta import row_hashes, schema
+        if isinstance(frame, SpilledResult):
+            return ()
+        try:
+            return (frame.shape, tuple(map(tuple, schema(frame))), hash(row_hashes(frame).tobytes()))
+        except TypeError:
+            return None
+
+    def load_table(self, name, frame):
+        loaded = self.tables.get(name)
+        signature = self.signature(frame)
+        if loaded is not None and loaded[0]() is frame and signature is not None and loaded[1] == signature:
+            return
+        self.connection.execute(f'DROP TABLE IF EXISTS "{name}"')
+        self.tables.pop(name, None)
+        created = False
+        if isinstance(frame, SpilledResult) and not (isinstance(frame, LazyFrame) and frame._df is not None):
+            # Results on disk are copied chunk by chunk instead of being loaded whole
+            chunk_rows = int(self.config.get("stream_chunk_rows"))
+            for chunk in self.df_utils.storage.iter_chunks(frame.file_path, frame.file_format, chunk_rows):
+                chunk.to_sql(name, self.connection, if_exists='append', index=False)
+                created = True
+        if not created:
+            df = frame.load() if isinstance(frame, SpilledResult) else frame
+            df.to_sql(name, self.connection, index=False)
+        self.connection.commit()
+        self.tables[name] = (weakref.ref(frame), signature)
@@ -0,0 +1,73 @@
+import re
+from datetime import datetime
+from .config import Config
+
+# Where a partitioned query wants its predicate; without it the query is wrapped in a filtering SELECT
+PLACEHOLDER_RE = re.compile(r'\{\{\s*partition\s*\}\}')
+INTEGER_RE = re.compile(r'^-?\d+$')
+QUOTED_RE = re.compile(r"^'(.*)'$", re.DOTALL)
+
+def sql_literal(value):
+    # Only integers written the way the number would print go out bare. '007' or '00501' are
+    # string keys such as zip codes, and as numbers they would match other rows or none.
+    # Quoting a value in the directive, e.g. @partition::code:'501','502', always makes it a string
+    if isinstance(value, int):
+        return str(value)
+    text = str(value)
+    quoted = QUOTED_RE.match(text)
+    if quoted:
+        text = quoted.group(1)
+    elif INTEGER_RE.match(text) and str(int(text)) == text:
+        return text
+    return "'" + text.replace("'", "''") + "'"
+
+class PartitionPlanner:
+    def __init__(self):
+        self.config = Config()
+
+    def plan(self, options):
+        # Returns one SQL predicate per partition, or None for a directive without @partition::
+        spec = options.get('partition')
+        if not spec:
+            return None
+        column, _, values = spec.partition(':')
+        if not column or not values:
+            raise ValueError(f"Invalid @partition::{spec} (use column:start..end or column:value1,value2,...)")
+        count = options.get('parts')
+        if count is not None and int(count) < 1:
+            raise ValueError(f"Invalid @parts::{count}, expected a positive number")
+
+        if '..' in values:
+            start, _, end = values.partition('..')
+            bounds = self.split_range(start, end, int(count or self.config.get("partition_count")))
+            return [f"{column} >= {sql_literal(lo)} AND {column} < {sql_literal(hi)}" for lo, hi in zip(bounds, bounds[1:])]
+
+        items = [value for value in values.split(',') if value]
+        size = -(-len(items) // int(count)) if count else 1
+        return [f"{column} IN ({', '.join(sql_literal(value) for value in items[i:i + size])})" for i in range(0, len(items), size)]
+
+    def split_range(self, start, end, count):
+        if INTEGER_RE.match(start) and INTEGER_RE.match(end):
+            lo, hi = int(start), int(end)
+            if hi <= lo:
+                raise ValueError(f"Empty partition range {start}..{end}")
+            return sorted(set(lo + (hi - lo) * i // count for i in range(count + 1)))
+
+        try:
+            lo, hi = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        except ValueError:
+            raise ValueError(f"Invalid partition range {start}..{end} (use integers or ISO dates such as 2024-01-01)")
+        if hi <= lo:
+            raise ValueError(f"Empty partition range {start}..{end}")
+        bounds = [lo + (hi - lo) * i / count for i in range(count + 1)]
+        if len(start) == 10 and len(end) == 10:
+            # Date ranges are cut at midnight, so a range shorter than count days gets fewer partitions
+            days = sorted(set(bound.date() for bound in bounds[:-1]) | {hi.date()})
+            return [day.isoformat() for day in days]
+        return [bound.isoformat(sep=' ') for bound in bounds]
+
+    def apply(self, query, predicate):
+        if PLACEHOLDER_RE.search(query):
+            return PLACEHOLDER_RE.sub(lambda _: f"({predicate})", query)
+        query = query.strip().rstrip(';').strip()
+        return f"SELECT * FROM (\n{query}\n) AS datasling_partition WHERE {predicate}"
@@ -0,0 +1,161 @@
+import time
+import atexit
+import threading
+from .config import Config
+from .cache import parse_duration
+
+class ConnectionPool:
+    def __init__(self, drivers):
+        self.config = Config()
+        self.drivers = drivers
+        self.cond = threading.Condition()
+        # preset -> [(conn, returned_at)], most recently returned last
+        self.idle = {}
+        # preset -> connections open, idle or in use
+        self.open = {}
+        # preset -> [opened, reused, setup seconds, dropped]
+        self.counters = {}
+        self.reaper = None
+        atexit.register(self.close_all)
+
+    def enabled(self):
+        return bool(self.config.get("connection_pool"))
+
+    def max_size(self):
+        return max(1, int(self.config.get("pool_size")))
+
+    def idle_timeout(self):
+        return parse_duration(self.config.get("pool_idle_timeout"), "pool idle timeout") or 0
+
+    def acquire(self, preset):
+        if not self.enabled():
+            return self.drivers.connect(preset)
+        while True:
+            conn = None
+            with self.cond:
+                while True:
+                    idle = self.idle.get(preset)
+                    if idle:
+                        conn, returned_at = idle.pop()
+                        break
+                    if self.open.get(preset, 0) < self.max_size():
+                        self.open[preset] = self.open.get(preset, 0) + 1
+                        break
+                    # Every connection of this preset is busy and the pool is full
+                    self.cond.wait()
+            if conn is None:
+                return self._open(preset)
+            # Connections that sat idle for a while may have been dropped by the server
+            if time.time() - returned_at < float(self.config.get("pool_check_after")) or self.healthy(conn):
+                with self.cond:
+                    self._counters(preset)[1] += 1
+                return conn
+            self._drop(preset, conn)
+
+    def release(self, preset, conn, reusable=True):
+        if not self.enabled():
+            self._close(conn)
+            return
+        if reusable:
+            try:
+                # Ends the read transaction, so the next query sees current data
+                conn.rollback()
+            except Exception:
+                reusable = False
+        if not reusable:
+            self._drop(preset, conn)
+            return
+        with self.cond:
+            self.idle.setdefault(preset, []).append((conn, time.time()))
+            self.cond.notify_all()
+            if self.reaper is None and self.idle_timeout() > 0:
+                self.reaper = threading.Thread(target=self._reap, name="connection-reaper", daemon=True)
+                self.reaper.start()
+
+    def healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _open(self, preset):
+        start = time.perf_counter()
+        try:
+            conn = self.drivers.connect(preset)
+        except Exception:
+            with self.cond:
+                self.open[preset] -= 1
+                self.cond.notify_all()
+            raise
+        with self.cond:
+            counters = self._counters(preset)
+            counters[0] += 1
+            counters[2] += time.perf_counter() - start
+        return conn
+
+    def _drop(self, preset, conn):
+        with self.cond:
+            self.open[preset] -= 1
+            self._counters(preset)[3] += 1
+            self.cond.notify_all()
+        self._close(conn)
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _counters(self, preset):
+        # Called with self.cond held
+        return self.counters.setdefault(preset, [0, 0, 0.0, 0])
+
+    def _reap(self):
+        while True:
+            timeout = self.idle_timeout()
+            if timeout <= 0:
+                with self.cond:
+                    self.reaper = None
+                return
+            time.sleep(min(timeout / 2, 60))
+            expired = []
+            with self.cond:
+                cutoff = time.time() - timeout
+                for preset, idle in self.idle.items():
+                    expired.extend((preset, conn) for conn, returned_at in idle if returned_at < cutoff)
+                    idle[:] = [(conn, returned_at) for conn, returned_at in idle if returned_at >= cutoff]
+                for preset, _ in expired:
+                    self.open[preset] -= 1
+                self.cond.notify_all()
+            for _, conn in expired:
+                self._close(conn)
+
+    def close_all(self):
+        with self.cond:
+            idle, self.idle = self.idle, {}
+            for preset, conns in idle.items():
+                self.open[preset] -= len(conns)
+        for conns in idle.values():
+            for conn, _ in conns:
+                self._close(conn)
+
+    def show(self):
+        with self.cond:
+            presets = {preset: (self.open.get(preset, 0), len(self.idle.get(preset, [])), list(counters))
+                       for preset, counters in self.counters.items()}
+        if not self.enabled():
+            print(f"{self.config.HEADING_COLOR}Connection pool:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Disabled; every query opens its own connection.{self.config.RESET_COLOR}")
+            return
+        if not presets:
+            print(f"{self.config.HEADING_COLOR}Connection pool:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No connections opened yet.{self.config.RESET_COLOR}")
+            return
+        print(f"{self.config.HEADING_COLOR}Connection pool (at most {self.max_size()} per preset, idle connections close after {self.idle_timeout():.0f}s):{self.config.RESET_COLOR}")
+        for preset, (open_count, idle_count, (opened, reused, setup, dropped)) in sorted(presets.items()):
+            average = setup / opened if opened else 0.0
+            print(f"{self.config.CONTENT_COLOR}  {preset}: {open_count} open ({idle_count} idle)  |  opened {opened} taking {average:.3f}s each on average  |  "
+                  f"reused {reused} time(s), saving about {reused * average:.2f}s  |  dropped {dropped}{self.config.RESET_COLOR}")
+        print()
@@ -0,0 +1,70 @@
+import time
+from contextlib import contextmanager
+
+PHASES = ('queue', 'connect', 'execute', 'fetch', 'build', 'persist')
+
+def format_bytes(nbytes):
+    if nbytes is None:
+        return "-"
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if nbytes < 1024 or unit == 'GB':
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+class QueryProfile:
+    def __init__(self):
+        self.timings = {}
+        self.row_count = None
+        self.col_count = None
+        self.byte_size = None
+        # Estimated from frame sizes, not measured: queries share the process, so its memory is not theirs alone
+        self.mem_estimate = None
+        self.compaction = None
+        self.shared_from = None
+        self.open_phases = {}
+        self.frozen = False
+        self.rows_fetched = 0
+        # Called as listener(event, value) when a phase starts or rows arrive, to report progress
+        self.listener = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self.open_phases[name] = start
+        if self.listener and not self.frozen:
+            self.listener('phase', name)
+        try:
+            yield
+        finally:
+            self.open_phases.pop(name, None)
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        if not self.frozen:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def interrupt(self):
+        # Keep the time spent so far in unfinished phases and ignore anything the
+        # abandoned query records afterwards
+        now = time.perf_counter()
+        for name, start in list(self.open_phases.items()):
+            self.add(name, now - start)
+        self.frozen = True
+
+    def add_rows(self, count):
+        self.rows_fetched += count
+        if self.listener and not self.frozen:
+            self.listener('rows', self.rows_fetched)
+
+    def merge(self, other):
+        # Partitions of one directive add up to its cost
+        for name, seconds in other.timings.items():
+            self.add(name, seconds)
+        if other.mem_estimate is not None:
+            self.mem_estimate = (self.mem_estimate or 0) + other.mem_estimate
+
+    def estimate_memory(self, nbytes):
+        self.mem_estimate = max(self.mem_estimate or 0, int(nbytes))
+
+    def as_row(self):
+        return tuple(self.timings.get(phase) for phase in PHASES) + (self.row_count, self.byte_size, self.mem_estimate, self.col_count)
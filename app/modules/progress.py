@@ -0,0 +1,107 @@
+import sys
+import time
+import shutil
+import threading
+from .config import Config
+from .run_status import FINISHED_STATES
+
+class ProgressBoard:
+    def __init__(self, status):
+        self.config = Config()
+        self.status = status
+        # Redrawing needs a terminal; logs and pipes get one plain line per event instead
+        self.interactive = sys.stdout.isatty()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.drawn_lines = 0
+        self.started = set()
+        self.log_lock = threading.Lock()
+
+    def start(self):
+        if self.interactive:
+            self.thread = threading.Thread(target=self._redraw_loop, name="progress-board", daemon=True)
+            self.thread.start()
+        else:
+            self.status.add_listener(self._log)
+
+    def stop(self):
+        if not self.interactive:
+            self.status.remove_listener(self._log)
+            return
+        self.stop_event.set()
+        with self.status.cond:
+            self.status.cond.notify_all()
+        self.thread.join()
+        # The last frame stays on screen as the record of the run
+        self.draw()
+
+    def _redraw_loop(self):
+        interval = max(0.05, float(self.config.get("progress_interval")))
+        while not self.stop_event.is_set():
+            drawn_at = time.time()
+            version = self.draw()
+            # Redraw when something changes, but at most once per interval; elapsed times tick once a second
+            self.status.wait_for_change(version, 1.0)
+            self.stop_event.wait(max(0.0, interval - (time.time() - drawn_at)))
+
+    def draw(self):
+        version, states = self.status.snapshot()
+        columns, rows = shutil.get_terminal_size()
+        lines = self.render(states, time.time(), columns - 1, max(3, rows - 2))
+        # Move back to the first line of the previous frame and clear everything below it
+        prefix = f"\033[{self.drawn_lines}F\033[J" if self.drawn_lines else ""
+        sys.stdout.write(prefix + "".join(line + "\n" for line in lines))
+        sys.stdout.flush()
+        self.drawn_lines = len(lines)
+        return version
+
+    def render(self, states, now, width, height):
+        counts = {}
+        for entry in states.values():
+            counts[entry[0]] = counts.get(entry[0], 0) + 1
+        summary = ", ".join(f"{count} {state}" for state, count in sorted(counts.items()))
+        total = now - self.status.started_at if self.status.started_at else 0.0
+        lines = [f"{self.config.HEADING_COLOR}{f'Running {len(states)} directive(s): {summary}  {total:.1f}s'[:width]}{self.config.RESET_COLOR}"]
+
+        names = list(states)
+        hidden = 0
+        if len(names) > height - 1:
+            # Keep every unfinished directive in view and as many of the latest finished ones as fit
+            active = [name for name in names if states[name][0] not in FINISHED_STATES]
+            finished = sorted((name for name in names if states[name][0] in FINISHED_STATES), key=lambda name: states[name][5], reverse=True)
+            shown = set(active[:height - 2]) | set(finished[:max(0, height - 2 - len(active))])
+            hidden = len(names) - len(shown)
+            names = [name for name in names if name in shown]
+
+        name_width = max((len(name) for name in names), default=0)
+        for name in names:
+            state, since, detail, rows = states[name][:4]
+            elapsed = self.status.elapsed(states[name], now)
+            text = (f"  {name.ljust(name_width)}  {state:10s} {f'{rows:,} rows' if rows is not None else '':>14s}"
+                    f" {f'{elapsed:.1f}s' if elapsed is not None else '':>8s}{'  ' + detail if detail else ''}")
+            lines.append(f"{self.config.CONTENT_COLOR}{text[:width]}{self.config.RESET_COLOR}")
+        if hidden:
+            lines.append(f"{self.config.CONTENT_COLOR}  ... and {hidden} more finished{self.config.RESET_COLOR}")
+        return lines
+
+    def _log(self, df_name, state, detail):
+        # Only starts and finishes; phase changes within a query would flood the log
+        if state in FINISHED_STATES:
+            _, states = self.status.snapshot()
+            entry = states.get(df_name)
+            elapsed = self.status.elapsed(entry, time.time()) if entry else None
+            rows = entry[3] if entry else None
+            facts = [fact for fact in (f"{rows} rows" if rows is not None else None, f"{elapsed:.2f}s" if elapsed is not None else None, detail) if fact]
+            line = f"{df_name}: {state}{' (' + ', '.join(facts) + ')' if facts else ''}"
+        elif state == 'queued' and detail:
+            line = f"{df_name}: {detail}"
+        else:
+            with self.log_lock:
+                if df_name in self.started or state == 'queued':
+                    return
+                self.started.add(df_name)
+            line = f"{df_name}: started"
+        # One write per line, so lines from different query threads never interleave
+        with self.log_lock:
+            sys.stdout.write(f"[{time.strftime('%H:%M:%S')}] {line}\n")
+            sys.stdout.flush()
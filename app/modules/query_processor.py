@@ -1,10 +1,28 @@
-import sys
+import copy
 import time
+import numbers
 import threading
+import functools
+from datetime import datetime
+from collections import ChainMap
 from .config import Config
 from .ui import UI
 from .file_utils import FileUtils
-from rgwfuncs import load_data_from_query
+from .executor import QueryExecutor, QueryJob
+from .cache import ResultCache, parse_duration
+from .streaming import StreamingFetcher, SpilledResult
+from .drivers import PresetDrivers
+from .pool import ConnectionPool
+from .partitions import PartitionPlanner
+from .local_sql import LocalSQL
+from .profiling import QueryProfile, format_bytes
+from .compaction import DtypeCompactor
+from .leases import QueryLeases
+from .cancellation import current_cancellation, load_query_in_process
+from .dag import DirectiveGraph, PANDAS_PRESET, LOCAL_PRESET, RESERVED_PRESETS, TEMPLATE_RE
+from .writer import HistoryWriter
+from .run_status import RunStatus
+from .progress import ProgressBoard
 
 class QueryProcessor:
     def __init__(self, history_manager):
@@ -12,96 +30,515 @@ class QueryProcessor:
         self.ui = UI()
         self.file_utils = FileUtils()
         self.history_manager = history_manager
+        self.executor = QueryExecutor()
+        self.cache = ResultCache(history_manager)
+        self.drivers = PresetDrivers()
+        # Owned by the session, so every run() reuses connections opened by earlier ones
+        self.pool = ConnectionPool(self.drivers)
+        self.streaming = StreamingFetcher(self.pool)
+        self.compactor = DtypeCompactor()
+        self.partitions = PartitionPlanner()
+        self.local_sql = LocalSQL(self.streaming.df_utils)
+        self.writer = HistoryWriter(history_manager.db)
+        self.leases = QueryLeases()
+        self.status = RunStatus()
+        self.publish_to = None
+        # Directives whose history entry was saved as soon as they finished, and the leases still being saved
+        self.saved_early = set()
+        self.committing = set()
         self.lock = threading.Lock()  # Lock for synchronizing dictionary access
 
-    def process_query(self, query, preset, result_dict, df_name, start_time_dict, end_time_dict):
+    def process_query(self, query, preset, options, result_dict, df_name, start_time_dict, end_time_dict, deps=(), inputs=None, profile=None, parts=None):
+        profile = profile or QueryProfile()
+        lease = None
         try:
             with self.lock:  # Synchronize access to dictionaries
-                start_time_dict[df_name] = time.time()
-            df = load_data_from_query(query, preset=preset)
+                # A partitioned directive started with its first partition
+                start_time_dict.setdefault(df_name, time.time())
+            self.status.update(df_name, 'running')
+            failed = [dep for dep in deps if isinstance(inputs.get(dep), str)]
+            if failed:
+                raise ValueError(f"Upstream directive(s) failed: {', '.join(failed)}")
+            if parts is not None:
+                df = self.combine_partitions(df_name, parts, profile)
+            elif preset == PANDAS_PRESET:
+                with profile.phase('build'):
+                    df = self.evaluate_pandas(query, deps, inputs)
+            elif preset == LOCAL_PRESET:
+                # Inputs and frames already in the shell are tables; nothing leaves the machine
+                with profile.phase('execute'):
+                    df = self.local_sql.query(self.render_query(query, inputs), inputs)
+            else:
+                query = self.render_query(query, inputs)
+                if not deps and self.leases.enabled():
+                    df, lease = self.fetch_once(df_name, preset, query, options, profile)
+                else:
+                    df = self.fetch(df_name, preset, query, options, profile)
+            if not isinstance(df, SpilledResult) and self.compactor.enabled(options):
+                with profile.phase('build'):
+                    df, before, after = self.compactor.compact(df)
+                profile.compaction = (before, after)
             with self.lock:  # Synchronize access to dictionaries
+                if current_cancellation().cancelled:
+                    self.leases.release([lease] if lease else [])
+                    return
                 result_dict[df_name] = df
                 end_time_dict[df_name] = time.time()
                 elapsed = end_time_dict[df_name] - start_time_dict[df_name]
-                print(f"{self.config.CONTENT_COLOR} Done '{df_name}'{self.config.RESET_COLOR}")
+                self.finish(df_name, 'done', df, elapsed)
+            if lease:
+                self.commit_leased(df_name, preset, query, options, df, profile, lease)
         except Exception as e:
+            if lease:
+                self.leases.release([lease])
             with self.lock:  # Synchronize access to dictionaries
+                if current_cancellation().cancelled:
+                    # Timed out; the executor has already recorded the result
+                    return
                 result_dict[df_name] = f"Error executing query: {str(e)}"
                 end_time_dict[df_name] = time.time()
                 elapsed = end_time_dict[df_name] - start_time_dict[df_name]
-                print(f"{self.config.HEADING_COLOR}Error '{df_name}': {elapsed:.2f}s - {str(e)}{self.config.RESET_COLOR}")
+                self.finish(df_name, 'failed', str(e), elapsed)
+
+    def process_partition(self, df_name, index, query, preset, options, predicate, deps, inputs, parts, start_time_dict):
+        key, profile = parts['keys'][index], parts['profiles'][index]
+        with self.lock:
+            start_time_dict.setdefault(df_name, time.time())
+        self.status.update(key, 'running')
+        self.status.update(df_name, 'running', f"{len(parts['keys'])} partitions")
+        failed = [dep for dep in deps if isinstance(inputs.get(dep), str)]
+        retries = 0 if failed else max(0, int(options.get('retries', self.config.get("partition_retries"))))
+        for attempt in range(retries + 1):
+            try:
+                if failed:
+                    raise ValueError(f"Upstream directive(s) failed: {', '.join(failed)}")
+                sql = self.partitions.apply(self.render_query(query, inputs), predicate)
+                result = self.fetch(key, preset, sql, options, profile)
+                break
+            except Exception as e:
+                if current_cancellation().cancelled:
+                    return
+                if attempt == retries:
+                    with self.lock:
+                        parts['results'][index] = str(e)
+                    self.status.update(key, 'failed', str(e))
+                    return
+                # Only this partition runs again; the others keep their results
+                self.status.update(key, 'queued', f"attempt {attempt + 1} failed, retrying: {e}")
+                time.sleep(min(2 ** attempt, 30))
+        with self.lock:
+            if current_cancellation().cancelled:
+                return
+            parts['results'][index] = result
+            rows = result.row_count if isinstance(result, SpilledResult) else len(result)
+            self.status.update(key, 'done', f"attempt {attempt + 1}" if attempt else None, rows)
+
+    def partition_timed_out(self, parts, index, job):
+        profile = parts['profiles'][index]
+        profile.interrupt()
+        message = "Timed out before it started (run timeout)" if job.started_at is None else f"Timed out after {job.run_time:.2f}s"
+        with self.lock:
+            parts['results'][index] = message
+        self.status.update(job.key, 'timeout', message)
+
+    def combine_partitions(self, df_name, parts, profile):
+        import pandas as pd
+        for part_profile in parts['profiles']:
+            profile.merge(part_profile)
+        failed = [f"{key}: {result}" for key, result in zip(parts['keys'], parts['results']) if result is None or isinstance(result, str)]
+        if failed:
+            raise ValueError(f"{len(failed)} of {len(parts['keys'])} partition(s) failed: {'; '.join(failed)}")
+        results = parts['results']
+        if any(isinstance(result, SpilledResult) for result in results):
+            with profile.phase('persist'):
+                return self.streaming.concat(df_name, results)
+        with profile.phase('build'):
+            return pd.concat(results, ignore_index=True)
+
+    def fetch(self, df_name, preset, query, options, profile):
+        if self.streaming.enabled(preset, options):
+            return self.streaming.fetch(df_name, preset, query, profile)
+        return self.fetch_dataframe(preset, query, profile)
+
+    def spill_as(self, df_name, preset, options):
+        # Streamed directives read from history stay on disk as well; no warning here,
+        # fetch() gives it when a preset cannot stream
+        if self.streaming.requested(options) and self.drivers.supports(preset):
+            return df_name
+        return None
+
+    def fetch_once(self, df_name, preset, query, options, profile):
+        # A session running this query holds its lease until the result is committed to
+        # history, so other sessions wait for that result instead of running it again.
+        # Returns the result and the lease this call took, if any
+        query_hash = self.file_utils.query_hash(preset, query, options)
+        lease = self.leases.key(query_hash, options)
+        if self.leases.holds(lease):
+            # Already running in this process, e.g. from an earlier run() still being saved
+            return self.fetch(df_name, preset, query, options, profile), None
+        while not self.leases.try_acquire(lease):
+            holder = self.leases.holder(lease) or {}
+            self.status.update(df_name, 'queued', f"already running in another session (pid {holder.get('pid', '?')})")
+            with profile.phase('queue'):
+                self.leases.wait(lease)
+            since = datetime.fromtimestamp(holder.get('started', time.time())).isoformat()
+            df, timestamp = self.history_manager.get_cached_df(query_hash, since, self.spill_as(df_name, preset, options))
+            if df is not None:
+                profile.shared_from = timestamp
+                return df, None
+            # The other session failed or gave up, so this one tries
+        try:
+            return self.fetch(df_name, preset, query, options, profile), lease
+        except Exception:
+            self.leases.release([lease])
+            raise
+
+    def commit_leased(self, df_name, preset, query, options, df, profile, lease):
+        # Sessions waiting on the lease need this result in history, so it is saved and the
+        # lease released on its own instead of with the rest of the run; two sessions that
+        # each hold a lease the other waits on would otherwise wait on each other for good
+        spilled = df if isinstance(df, SpilledResult) else None
+        entry = dict(df_name=df_name, preset=preset, query=query, df=None if spilled else df, profile=profile, spilled=spilled, options=options)
+        with self.lock:
+            self.saved_early.add(df_name)
+            self.committing.add(lease)
+
+        def committed(_=None):
+            self.leases.release([lease])
+            with self.lock:
+                self.committing.discard(lease)
+
+        if self.config.get("background_writes"):
+            self.writer.submit_run([entry]).add_done_callback(committed)
+            return
+        try:
+            self.history_manager.db.save_history_entry(**entry)
+        finally:
+            committed()
+
+    def share_result(self, leader, df_name, result_dict, start_time_dict, end_time_dict):
+        with self.lock:
+            start_time_dict[df_name] = time.time()
+            df = result_dict[leader]
+            if isinstance(df, SpilledResult):
+                df = copy.copy(df)
+                df.df_name = df_name
+            elif not isinstance(df, str):
+                # Deep, so editing one name in the shell never changes the other
+                df = df.copy()
+            result_dict[df_name] = df
+            end_time_dict[df_name] = time.time()
+            self.finish(df_name, 'failed' if isinstance(df, str) else 'done', df, 0.0)
+
+    def mark_timed_out(self, result_dict, start_time_dict, end_time_dict, profile, job):
+        profile.interrupt()
+        with self.lock:  # Synchronize access to dictionaries
+            if job.started_at is None:
+                message = "Timed out before it started (run timeout)"
+            else:
+                message = f"Timed out after {job.run_time:.2f}s"
+            result_dict[job.key] = message
+            start_time_dict.setdefault(job.key, job.started_at or job.finished_at)
+            end_time_dict[job.key] = job.finished_at
+            self.finish(job.key, 'timeout', message, job.run_time)
+
+    def job_started(self, profile, job):
+        # At the start, so results saved while the run goes on already carry their queue time
+        profile.add('queue', job.wait_time)
+
+    def finish(self, df_name, state, result, elapsed):
+        # Called with self.lock held
+        if state in ('done', 'cached'):
+            rows = result.row_count if isinstance(result, SpilledResult) else len(result)
+            self.status.update(df_name, state, None, rows)
+        else:
+            self.status.update(df_name, state, result)
+        if self.publish_to is None:
+            # The progress board reports it
+            return
+        # The shell is already open: publish the result and say so in one line
+        if state in ('done', 'cached'):
+            self.publish_to[df_name] = result
+            if isinstance(result, SpilledResult):
+                shape = f"{result.row_count} rows x {result.col_count} columns, on disk"
+            else:
+                shape = f"{result.shape[0]} rows x {result.shape[1]} columns"
+            print(f"\n{self.config.CONTENT_COLOR}[datasling] '{df_name}' is ready ({shape}, {elapsed:.2f}s){self.config.RESET_COLOR}")
+        else:
+            print(f"\n{self.config.HEADING_COLOR}[datasling] '{df_name}' {state}: {result}{self.config.RESET_COLOR}")
+
+    def start_background_run(self, filepaths, global_namespace, save_callback):
+        # Names are known before the shell opens, so wait() works right away
+        self.status.reset([q[0] for q in self.file_utils.collect_manifest(filepaths)])
+
+        def run():
+            try:
+                self.process_all_queries(filepaths, global_namespace, save_callback, progressive=True)
+            except Exception as e:
+                print(f"\n{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+                self.status.reset([])
+
+        thread = threading.Thread(target=run, name="datasling-run")
+        thread.start()
+        return thread
+
+    def wait(self, df_names=None, timeout=None, global_namespace=None):
+        names = [df_names] if isinstance(df_names, str) else df_names
+        if not self.status.wait(names, timeout):
+            print(f"{self.config.HEADING_COLOR}Still running:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{', '.join(self.status.in_flight())}{self.config.RESET_COLOR}")
+            return None
+        if isinstance(df_names, str) and global_namespace is not None:
+            return global_namespace.get(df_names)
+        return None
+
+    def sql(self, query, global_namespace):
+        try:
+            return self.local_sql.query(query, global_namespace)
+        except Exception as e:
+            print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+            return None
 
-    def run_local(self, original_filepaths, global_namespace, save_callback):
+    def fetch_dataframe(self, preset, query, profile):
+        import pandas as pd
+        cancellation = current_cancellation()
+        if not self.drivers.supports(preset):
+            # rgwfuncs connects, executes and fetches in one call, so it is timed as a whole
+            with profile.phase('execute'):
+                if cancellation.timeout:
+                    return load_query_in_process(query, preset, cancellation)
+                from rgwfuncs import load_data_from_query
+                return load_data_from_query(query, preset=preset)
+
+        with profile.phase('connect'):
+            conn = self.pool.acquire(preset)
+        reusable = False
+        try:
+            cursor = conn.cursor()
+            with cancellation.cancelling(self.drivers.canceller(preset, conn) or (lambda: None)):
+                with profile.phase('execute'):
+                    cursor.execute(query)
+                rows = []
+                chunk_rows = int(self.config.get("stream_chunk_rows"))
+                with profile.phase('fetch'):
+                    # In chunks, so the progress board can count rows as they arrive
+                    while True:
+                        chunk = cursor.fetchmany(chunk_rows)
+                        if not chunk:
+                            break
+                        rows.extend(chunk)
+                        profile.add_rows(len(chunk))
+            columns = [d[0] for d in cursor.description] if cursor.description else []
+            cursor.close()
+            # A connection whose query was cancelled is not handed out again
+            reusable = not cancellation.cancelled
+            with profile.phase('build'):
+                return pd.DataFrame.from_records(rows, columns=columns)
+        finally:
+            self.pool.release(preset, conn, reusable)
+
+    def input_frame(self, inputs, df_name):
+        df = inputs[df_name]
+        return df.load() if isinstance(df, SpilledResult) else df
+
+    def render_query(self, query, inputs):
+        def sql_literal(value):
+            if isinstance(value, numbers.Number) and not isinstance(value, bool):
+                return str(value)
+            return "'" + str(value).replace("'", "''") + "'"
+
+        def replace(match):
+            values = self.input_frame(inputs, match.group(1))[match.group(2)].dropna().unique()
+            # An empty list still has to be valid SQL inside IN (...)
+            return ", ".join(sql_literal(v) for v in values) if len(values) else "NULL"
+
+        return TEMPLATE_RE.sub(replace, query)
+
+    def evaluate_pandas(self, expression, deps, inputs):
+        import pandas as pd
+        scope = {'pd': pd}
+        scope.update((dep, self.input_frame(inputs, dep)) for dep in deps)
+        df = eval(expression, scope)
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError(f"pandas directive returned {type(df).__name__}, expected a DataFrame")
+        return df
+
+    def run_local(self, original_filepaths, global_namespace, save_callback, force=False):
+        if self.status.in_flight():
+            print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}The current run is still in progress; use wait() or status() first.{self.config.RESET_COLOR}")
+            return
         if original_filepaths:
             print(f"{self.config.HEADING_COLOR}Re-running queries from {len(original_filepaths)} file(s):{self.config.RESET_COLOR}")
             self.ui.animate_loading("Processing queries...")
-            self.process_all_queries(original_filepaths, global_namespace, save_callback, historic=False)
+            self.process_all_queries(original_filepaths, global_namespace, save_callback, historic=False, incremental=not force)
         else:
             print(f"{self.config.HEADING_COLOR}Error:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR} No original file paths available to re-run queries.{self.config.RESET_COLOR}")
 
-    def process_all_queries(self, filepaths, global_namespace, save_callback, historic=False):
-        all_queries = []
-        for filepath in filepaths:
-            queries = self.file_utils.collect_queries(filepath)
-            all_queries.extend(queries)
+    def unchanged_directives(self, all_queries, global_namespace, graph):
+        last_runs = self.history_manager.get_last_fingerprints([q[0] for q in all_queries])
+        unchanged = set()
+        for df_name, preset, query, options in all_queries:
+            if df_name not in global_namespace or isinstance(global_namespace[df_name], str) or df_name in self.history_manager.reloaded:
+                continue
+            fingerprint, status = last_runs.get(df_name, (None, None))
+            if status == 'ok' and fingerprint == self.file_utils.directive_fingerprint(df_name, preset, query, options):
+                unchanged.add(df_name)
+        # Anything fed by a directive that is about to re-run has to re-run as well
+        return unchanged - graph.downstream_of(set(graph.directives) - unchanged)
+
+    def process_all_queries(self, filepaths, global_namespace, save_callback, historic=False, incremental=False, progressive=False):
+        all_queries = self.file_utils.collect_manifest(filepaths)
 
         if not all_queries:
             raise ValueError("No valid SQL queries found in any file.")
 
-        threads = []
+        # Entries from the previous run must be indexed before cache and fingerprint lookups
+        self.writer.flush()
+
+        graph = DirectiveGraph(all_queries)
+        if not historic:
+            import pandas as pd
+            clashes = sorted(set(q[1] for q in all_queries if q[1] in RESERVED_PRESETS and self.drivers.defined(q[1])))
+            if clashes:
+                raise ValueError(f"Preset name(s) {', '.join(clashes)} are built into datasling and also defined in .rgwfuncsrc; rename the .rgwfuncsrc preset(s)")
+            graph.validate([name for name, value in global_namespace.items() if isinstance(value, (pd.DataFrame, SpilledResult))])
+
+        jobs = []
         results = {}
         start_times = {}
         end_times = {}
+        cached = {}
+        profiles = {}
+        leaders = {}
+        followers = {}
+        partitioned = {}
+        unchanged = set()
+        inputs = ChainMap(results, global_namespace)
+        entries = []
+        self.saved_early = set()
+
+        def persist(df_name, preset, query, df=None, **kwargs):
+            if df_name in self.saved_early:
+                return
+            entries.append(dict(df_name=df_name, preset=preset, query=query, df=df, profile=profiles.get(df_name), **kwargs))
+
+        if incremental and not historic:
+            unchanged = self.unchanged_directives(all_queries, global_namespace, graph)
+            if unchanged:
+                print(f"{self.config.HEADING_COLOR}Skipping {len(unchanged)} unchanged directive(s) (use run(force=True) to re-run them):{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{', '.join(sorted(unchanged))}{self.config.RESET_COLOR}")
+        self.status.reset([q[0] for q in all_queries if q[0] not in unchanged])
+        if not historic:
+            # Fetched again below, so no longer reloads
+            self.history_manager.reloaded.difference_update(q[0] for q in all_queries if q[0] not in unchanged)
 
         if historic:
-            for df_name, preset, query in all_queries:
-                df, hist_preset, hist_query, timestamp = self.history_manager.get_historic_df(df_name)
+            loaded = self.history_manager.load_historic([q[0] for q in all_queries], self.config.get("lazy_load"), global_namespace)
+            for df_name, preset, query, options in all_queries:
+                df, hist_preset, hist_query, timestamp = loaded.get(df_name, (None, None, None, None))
                 with self.lock:
                     start_times[df_name] = time.time()
                     end_times[df_name] = time.time()
+                    self.status.update(df_name, 'done' if df is not None else 'failed')
                     if df is not None:
                         results[df_name] = df
+                        self.history_manager.reloaded.add(df_name)
                         print(f"{self.config.HEADING_COLOR}Loaded historic {df_name} (preset: {hist_preset}, timestamp: {timestamp}):{self.config.RESET_COLOR}")
                         print(f"{self.config.CONTENT_COLOR}{df}{self.config.RESET_COLOR}")
                         print()
-                        save_callback(df_name, hist_preset, hist_query, df)
+                        # Recorded as a reload, so run() does not take it for a run of the current directive
+                        if isinstance(df, SpilledResult):
+                            persist(df_name, hist_preset, hist_query, None, cacheable=False, spilled=df, status='historic', options=options)
+                        else:
+                            persist(df_name, hist_preset, hist_query, df, cacheable=False, status='historic', options=options)
                     else:
                         print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No historic data found for {df_name}{self.config.RESET_COLOR}")
                         results[df_name] = f"No historic data available"
         else:
-            # Start total time counter thread
-            stop_counter = threading.Event()
-            def total_time_counter(start_time):
-                last_length = 0
-                while not stop_counter.is_set():
-                    elapsed = time.time() - start_time
-                    counter_line = f"{self.config.CONTENT_COLOR}Total time: {elapsed:.2f}s{self.config.RESET_COLOR}"
-                    plain_counter = f"Total time: {elapsed:.2f}s"
-                    sys.stdout.write(f"\r{' ' * last_length}\r{counter_line}")
-                    sys.stdout.flush()
-                    last_length = len(plain_counter)
-                    time.sleep(0.01)  # Update every 0.5 seconds
-                # Clear the counter line
-                sys.stdout.write(f"\r{' ' * last_length}\r")
-                sys.stdout.flush()
-
-            # Start query threads
+            # With the shell already open, results are published as they finish
+            self.publish_to = global_namespace if progressive else None
+            # Redrawn as directives change state, instead of on a timer
+            board = None if progressive else ProgressBoard(self.status)
             process_start_time = time.time()
-            counter_thread = threading.Thread(target=total_time_counter, args=(process_start_time,))
-            counter_thread.start()
+            if board:
+                board.start()
 
-            for df_name, preset, query in all_queries:
-                thread = threading.Thread(target=self.process_query, args=(query, preset, results, df_name, start_times, end_times))
-                threads.append(thread)
-                thread.start()
+            for df_name, preset, query, options in all_queries:
+                if df_name in unchanged:
+                    continue
+                deps = graph.deps[df_name]
+                # Copies of one query under several names run once and share the result
+                share_key = (preset, self.file_utils.normalize_query(query), tuple(sorted((k, v) for k, v in options.items() if k != 'ttl')))
+                if share_key in leaders:
+                    leader = followers[df_name] = leaders[share_key]
+                    jobs.append(QueryJob(df_name, preset, self.share_result, (leader, df_name, results, start_times, end_times), [leader]))
+                    continue
+                leaders[share_key] = df_name
+                cache_start = time.time()
+                # Directives fed by other results only know their final SQL once the inputs exist
+                df, timestamp = (None, None) if deps or preset in (PANDAS_PRESET, LOCAL_PRESET) else self.cache.lookup(preset, query, options, self.spill_as(df_name, preset, options))
+                if df is not None:
+                    results[df_name] = df
+                    start_times[df_name] = cache_start
+                    end_times[df_name] = time.time()
+                    cached[df_name] = timestamp
+                    with self.lock:
+                        self.finish(df_name, 'cached', df, end_times[df_name] - cache_start)
+                    continue
+                profiles[df_name] = QueryProfile()
+                profiles[df_name].listener = functools.partial(self.status.listen, df_name)
+                timeout = parse_duration(options.get('timeout', self.config.get("query_timeout")), "timeout")
+                try:
+                    predicates = None if preset in (PANDAS_PRESET, LOCAL_PRESET) else self.partitions.plan(options)
+                except ValueError as e:
+                    with self.lock:
+                        start_times[df_name] = end_times[df_name] = time.time()
+                        results[df_name] = f"Error executing query: {str(e)}"
+                        self.finish(df_name, 'failed', str(e), 0.0)
+                    continue
+                if predicates:
+                    # Each partition is a job of its own, so partitions share the global and
+                    # per-preset limits with every other query; the directive's own job joins them
+                    keys = [f"{df_name}[{i + 1}/{len(predicates)}]" for i in range(len(predicates))]
+                    parts = partitioned[df_name] = {'keys': keys, 'results': [None] * len(keys),
+                                                    'profiles': [QueryProfile() for _ in keys]}
+                    for i, (key, predicate) in enumerate(zip(keys, predicates)):
+                        parts['profiles'][i].listener = functools.partial(self.status.listen, key)
+                        jobs.append(QueryJob(key, preset, self.process_partition,
+                                             (df_name, i, query, preset, options, predicate, deps, inputs, parts, start_times), deps,
+                                             timeout=timeout if timeout and timeout > 0 else None,
+                                             on_timeout=functools.partial(self.partition_timed_out, parts, i)))
+                    jobs.append(QueryJob(df_name, preset, self.process_query,
+                                         (query, preset, options, results, df_name, start_times, end_times, deps, inputs, profiles[df_name], parts), keys))
+                    continue
+                jobs.append(QueryJob(df_name, preset, self.process_query,
+                                     (query, preset, options, results, df_name, start_times, end_times, deps, inputs, profiles[df_name]), deps,
+                                     timeout=timeout if timeout and timeout > 0 else None,
+                                     on_timeout=functools.partial(self.mark_timed_out, results, start_times, end_times, profiles[df_name]),
+                                     on_start=functools.partial(self.job_started, profiles[df_name])))
 
-            # Wait for all query threads to complete
-            for thread in threads:
-                thread.join()
+            # Queued queries start as global and per-preset slots free up and, for
+            # dependent directives, as soon as their inputs have finished
+            run_timeout = parse_duration(self.config.get("run_timeout"), "run timeout")
+            try:
+                self.executor.run(jobs, run_timeout if run_timeout and run_timeout > 0 else None)
+            finally:
+                self.publish_to = None
+                if board:
+                    board.stop()
+            wall_time = time.time() - process_start_time
+            waits = {job.key: job.wait_time for job in jobs}
+            for df_name, parts in partitioned.items():
+                # Waiting on its own partitions is not queueing; waiting for the first one to start is
+                profiles[df_name].add('queue', min(waits[key] for key in parts['keys']))
+            for job in jobs:
+                if job.key in profiles:
+                    if profiles[job.key].shared_from:
+                        cached[job.key] = profiles[job.key].shared_from
+            for df_name, leader in followers.items():
+                if leader in cached:
+                    cached[df_name] = cached[leader]
 
-            # Stop the counter thread
-            stop_counter.set()
-            counter_thread.join()
+
+        timed_out = set(job.key for job in jobs if job.timed_out)
 
         # Process DataFrames in ascending order of names
         for df_name in sorted(results.keys()):
@@ -112,14 +549,90 @@ class QueryProcessor:
                 elapsed_time = end_times.get(df_name, time.time()) - start_times.get(df_name, 0)
 
                 if isinstance(results[df_name], str):
-                    save_callback(df_name, query_tuple[1], query_text, None)
+                    persist(df_name, query_tuple[1], query_text, None, status='timeout' if df_name in timed_out else None, options=query_tuple[3])
                 elif not historic:
-                    global_namespace[df_name] = results[df_name]
-                    load_msg = f"{self.config.HEADING_COLOR}Loaded {df_name} (preset: {query_tuple[1]}, {elapsed_time:.2f}s):{self.config.RESET_COLOR}"
-                    self.ui.typewriter_print(load_msg)
-                    df_output = f"{self.config.CONTENT_COLOR}{results[df_name]}{self.config.RESET_COLOR}"
-                    print(df_output)
-                    print()
-                    save_callback(df_name, query_tuple[1], query_text, results[df_name])
+                    if not progressive:
+                        # In progressive mode finish() published it already, and the user may have reassigned it since
+                        global_namespace[df_name] = results[df_name]
+                    if df_name in cached:
+                        load_msg = f"{self.config.HEADING_COLOR}Loaded {df_name} (preset: {query_tuple[1]}, CACHED from {cached[df_name]}, {elapsed_time:.3f}s):{self.config.RESET_COLOR}"
+                    elif df_name in followers:
+                        load_msg = f"{self.config.HEADING_COLOR}Loaded {df_name} (preset: {query_tuple[1]}, same query as {followers[df_name]}):{self.config.RESET_COLOR}"
+                    else:
+                        compaction = profiles[df_name].compaction
+                        compacted = f", compacted {format_bytes(compaction[0])} -> {format_bytes(compaction[1])}" if compaction else ""
+                        load_msg = f"{self.config.HEADING_COLOR}Loaded {df_name} (preset: {query_tuple[1]}, {elapsed_time:.2f}s{compacted}):{self.config.RESET_COLOR}"
+                    if not progressive:
+                        self.ui.typewriter_print(load_msg)
+                        df_output = f"{self.config.CONTENT_COLOR}{results[df_name]}{self.config.RESET_COLOR}"
+                        print(df_output)
+                        print()
+                    # Cached results, streamed ones included, are in history already
+                    if df_name in cached:
+                        continue
+                    if isinstance(results[df_name], SpilledResult):
+                        persist(df_name, query_tuple[1], query_text, None, spilled=results[df_name], options=query_tuple[3])
+                    else:
+                        persist(df_name, query_tuple[1], query_text, results[df_name], options=query_tuple[3])
             else:
                 global_namespace[df_name] = results[df_name]
+
+        # Results are in the namespace already; files and history entries are written
+        # in the background unless background_writes is off
+        # Leases are released as each leased result is saved; any left over belong to queries
+        # abandoned after a timeout, which will not save anything
+        # New files may push history over its size budget, so eviction runs after each commit
+        with self.lock:
+            abandoned = self.leases.take_held() - self.committing
+        self.leases.release(abandoned)
+
+        def committed(_=None):
+            self.history_manager.db.retention.schedule()
+
+        if self.config.get("background_writes"):
+            commit = self.writer.submit_run(entries)
+            if commit is not None:
+                commit.add_done_callback(committed)
+            else:
+                committed()
+        else:
+            try:
+                with self.history_manager.db.batch():
+                    for entry in entries:
+                        save_callback(**entry)
+            finally:
+                committed()
+
+        if progressive:
+            failed = sum(1 for value in results.values() if isinstance(value, str))
+            print(f"\n{self.config.CONTENT_COLOR}[datasling] All {len(results)} directive(s) finished in {wall_time:.2f}s"
+                  f"{f', {failed} failed' if failed else ''}; status() shows each one{self.config.RESET_COLOR}")
+        elif jobs:
+            self.print_run_summary(jobs, graph, wall_time, partitioned)
+
+    def stats(self, limit=10, runs=5):
+        # The latest run only shows up once its history entries are committed
+        self.writer.flush()
+        self.history_manager.db.stats(limit, runs)
+
+    def diff(self, df_name, n=10):
+        self.writer.flush()
+        self.history_manager.diff(df_name, n)
+
+    def print_run_summary(self, jobs, graph, wall_time, partitioned=None):
+        print(f"{self.config.HEADING_COLOR}Run summary (max {self.executor.max_workers()} concurrent queries):{self.config.RESET_COLOR}")
+        width = max(len(job.key) for job in jobs)
+        for job in sorted(jobs, key=lambda j: j.key):
+            timed_out = "  TIMED OUT" if job.timed_out else ""
+            print(f"{self.config.CONTENT_COLOR}  {job.key.ljust(width)}  preset: {job.preset}  waited: {job.wait_time:.2f}s  ran: {job.run_time:.2f}s{timed_out}{self.config.RESET_COLOR}")
+        if any(job.deps for job in jobs):
+            by_key = {job.key: job for job in jobs}
+            durations = {job.key: job.run_time for job in jobs if job.key in graph.deps}
+            for df_name, parts in (partitioned or {}).items():
+                # A partitioned directive takes from its first partition starting to its partitions being combined
+                started = [by_key[key].started_at for key in parts['keys'] if by_key[key].started_at is not None]
+                if started and by_key[df_name].finished_at is not None:
+                    durations[df_name] = by_key[df_name].finished_at - min(started)
+            path_time, path = graph.critical_path(durations)
+            print(f"{self.config.CONTENT_COLOR}  Critical path: {' -> '.join(path)} ({path_time:.2f}s of {wall_time:.2f}s wall time){self.config.RESET_COLOR}")
+        print()
@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from .config import Config
+from .cache import parse_duration
+from .profiling import format_bytes
+from .delta import rows_path
+
+class HistoryRetention:
+    # One eviction pass at a time per process, however many Database objects ask for one
+    _lock = threading.Lock()
+    _thread = None
+    _rerun = False
+
+    BATCH_SIZE = 50
+
+    def __init__(self, db):
+        self.config = Config()
+        self.db = db
+
+    def budget(self):
+        max_mb = self.config.get("history_max_mb")
+        return int(float(max_mb) * 1024 * 1024) if max_mb else None
+
+    def max_age(self):
+        return parse_duration(self.config.get("history_max_age"), "history max age")
+
+    def schedule(self):
+        cls = HistoryRetention
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                # New results arrived while a pass was running; look again once it is done
+                cls._rerun = True
+                return
+            cls._thread = threading.Thread(target=self._run, name="history-eviction", daemon=True)
+            cls._thread.start()
+
+    def _run(self):
+        cls = HistoryRetention
+        while True:
+            try:
+                self.evict()
+            except Exception as e:
+                print(f"{self.config.HEADING_COLOR}Error evicting history files:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+            with cls._lock:
+                if not cls._rerun:
+                    return
+                cls._rerun = False
+
+    def usage(self):
+        with self.db.connection.cursor() as c:
+            # A file can back several entries; it was last used when any of them was
+            rows = c.execute('''SELECT file_path, MAX(COALESCE(last_used, timestamp)), MAX(COALESCE(pinned, 0)), MAX(base_path)
+                                FROM query_history
+                                WHERE file_path IS NOT NULL
+                                GROUP BY file_path''').fetchall()
+        files, missing, bases = {}, [], {}
+        for file_path, last_used, pinned, base_path in rows:
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                missing.append(file_path)
+                continue
+            if os.path.exists(rows_path(file_path)):
+                size += os.path.getsize(rows_path(file_path))
+            files[file_path] = (size, last_used, bool(pinned))
+            if base_path:
+                bases[file_path] = base_path
+
+        # A delta is unreadable without the files it builds on, so a chain is kept or evicted as a whole
+        root = {}
+
+        def find(file_path):
+            while root.get(file_path, file_path) != file_path:
+                file_path = root[file_path]
+            return file_path
+
+        for file_path, base_path in bases.items():
+            root[find(file_path)] = find(base_path)
+        units = {}
+        for file_path, (size, last_used, pinned) in files.items():
+            unit = units.setdefault(find(file_path), [[], 0, '', False])
+            unit[0].append(file_path)
+            unit[1] += size
+            unit[2] = max(unit[2], last_used or '')
+            unit[3] = unit[3] or pinned
+        return [tuple(unit) for unit in units.values()], missing
+
+    def evict(self):
+        files, missing = self.usage()
+        budget, max_age = self.budget(), self.max_age()
+        cutoff = (datetime.now() - timedelta(seconds=max_age)).isoformat() if max_age else None
+
+        total = sum(size for _, size, _, _ in files)
+        doomed = []
+        # Least recently used first; pinned files are never evicted
+        for file_paths, size, last_used, pinned in sorted(files, key=lambda f: f[2]):
+            if pinned:
+                continue
+            if (cutoff and last_used < cutoff) or (budget is not None and total > budget):
+                doomed.extend(file_paths)
+                total -= size
+
+        freed = 0
+        for start in range(0, len(doomed), self.BATCH_SIZE):
+            batch = doomed[start:start + self.BATCH_SIZE]
+            for file_path in batch + [rows_path(file_path) for file_path in batch]:
+                try:
+                    freed += os.path.getsize(file_path)
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"{self.config.HEADING_COLOR}Error deleting file {file_path}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+            self.forget(batch)
+            # Small transactions, so a running query's history commit never waits long
+            time.sleep(0)
+        self.forget(missing)
+
+        if cutoff:
+            with self.db.connection.cursor() as c:
+                c.execute('''DELETE FROM query_history
+                             WHERE file_path IS NULL AND COALESCE(pinned, 0) = 0
+                             AND COALESCE(last_used, timestamp) < ?''', (cutoff,))
+
+        if doomed:
+            print(f"{self.config.HEADING_COLOR}Evicted {len(doomed)} history file(s):{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}"
+                  f"freed {format_bytes(freed)}, {format_bytes(total)} kept{f' of {format_bytes(budget)}' if budget is not None else ''}{self.config.RESET_COLOR}")
+        return doomed
+
+    def forget(self, file_paths):
+        # Entries stay in history for history() and stats(), without a file to load
+        for start in range(0, len(file_paths), 500):
+            chunk = file_paths[start:start + 500]
+            with self.db.connection.cursor() as c:
+                c.execute(f"UPDATE query_history SET file_path = NULL WHERE file_path IN ({','.join('?' for _ in chunk)})", chunk)
@@ -0,0 +1,128 @@
+import time
+import threading
+from .config import Config
+
+FINISHED_STATES = ('done', 'cached', 'failed', 'timeout')
+# What a directive is doing while its query is in a given profiling phase
+PHASE_STATES = {'queue': 'queued', 'fetch': 'fetching', 'persist': 'persisting'}
+
+class RunStatus:
+    def __init__(self):
+        self.config = Config()
+        self.cond = threading.Condition()
+        self.states = {}
+        self.started_at = None
+        self.version = 0
+        self.listeners = []
+
+    def reset(self, df_names):
+        with self.cond:
+            now = time.time()
+            self.started_at = now
+            # df_name -> [state, since, detail, rows, started, ended]
+            self.states = {df_name: ['queued', now, None, None, None, None] for df_name in df_names}
+            self.changed()
+
+    def changed(self):
+        # Called with self.cond held
+        self.version += 1
+        self.cond.notify_all()
+
+    def update(self, df_name, state, detail=None, rows=None):
+        with self.cond:
+            now = time.time()
+            entry = self.states.setdefault(df_name, ['queued', now, None, None, None, None])
+            entry[0], entry[1], entry[2] = state, now, detail
+            if rows is not None:
+                entry[3] = rows
+            if entry[4] is None and state != 'queued':
+                entry[4] = now
+            if state in FINISHED_STATES:
+                entry[5] = now
+            self.changed()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(df_name, state, detail)
+
+    def listen(self, df_name, event, value):
+        # Progress reported by a QueryProfile; see QueryProfile.listener
+        if event == 'rows':
+            with self.cond:
+                if df_name in self.states:
+                    self.states[df_name][3] = value
+                    self.changed()
+            return
+        state = PHASE_STATES.get(value, 'running')
+        with self.cond:
+            current = self.states.get(df_name)
+            if current is None or current[0] in FINISHED_STATES or current[0] == state:
+                return
+            if value == 'build' and current[0] in ('fetching', 'persisting'):
+                # Building frames from fetched rows is still part of fetching
+                return
+            detail = current[2] if state == 'queued' else None
+        self.update(df_name, state, detail)
+
+    def add_listener(self, listener):
+        with self.cond:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.cond:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def snapshot(self):
+        with self.cond:
+            return self.version, {df_name: tuple(entry) for df_name, entry in self.states.items()}
+
+    def wait_for_change(self, version, timeout):
+        with self.cond:
+            if self.version == version:
+                self.cond.wait(timeout)
+            return self.version
+
+    def in_flight(self):
+        with self.cond:
+            return [df_name for df_name, entry in self.states.items() if entry[0] not in FINISHED_STATES]
+
+    def wait(self, df_names=None, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.cond:
+            names = list(self.states) if df_names is None else list(df_names)
+            unknown = [name for name in names if name not in self.states]
+            if unknown:
+                raise ValueError(f"Not part of the current run: {', '.join(unknown)}")
+            # A name dropped by a later reset() is not going to run, so it counts as finished
+            while any(self.states.get(name, ('done',))[0] not in FINISHED_STATES for name in names):
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+            return True
+
+    def elapsed(self, entry, now):
+        started, ended = entry[4], entry[5]
+        if started is None:
+            return None
+        return (ended or now) - started
+
+    def show(self):
+        _, states = self.snapshot()
+        if not states:
+            print(f"{self.config.HEADING_COLOR}Status:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}No queries have run in this session.{self.config.RESET_COLOR}")
+            return
+        now = time.time()
+        counts = {}
+        for entry in states.values():
+            counts[entry[0]] = counts.get(entry[0], 0) + 1
+        summary = ", ".join(f"{count} {state}" for state, count in sorted(counts.items()))
+        print(f"{self.config.HEADING_COLOR}Status ({summary}, {now - self.started_at:.1f}s since the run started):{self.config.RESET_COLOR}")
+        width = max(len(df_name) for df_name in states)
+        for df_name, entry in sorted(states.items(), key=lambda item: (item[1][0] in FINISHED_STATES, item[0])):
+            state, since, detail, rows = entry[:4]
+            elapsed = self.elapsed(entry, now)
+            timing = f"{elapsed:.1f}s" if elapsed is not None else f"waiting {now - since:.1f}s"
+            print(f"{self.config.CONTENT_COLOR}  {df_name.ljust(width)}  {state:10s} {timing:>9s}  {f'{rows} rows' if rows is not None else ''}"
+                  f"{'  ' + detail if detail else ''}{self.config.RESET_COLOR}")
+        print()
@@ -0,0 +1,178 @@
+import os
+from .config import Config
+from .delta import DELTA_FORMATS, read_rows, assemble
+
+class ResultStorage:
+    FORMATS = {}
+
+    def __init__(self):
+        self.config = Config()
+
+    @classmethod
+    def register_format(cls, name, extension, writer, reader, chunk_writer=None, chunk_reader=None):
+        cls.FORMATS[name] = (extension, writer, reader, chunk_writer, chunk_reader)
+
+    def default_format(self):
+        file_format = self.config.get("history_format")
+        return file_format if file_format in self.FORMATS else "csv"
+
+    def extension(self, file_format):
+        return self.FORMATS[file_format][0]
+
+    def format_for_path(self, file_path):
+        # Entries written before the file_format column existed are identified by extension
+        for name, (extension, _, _, _, _) in self.FORMATS.items():
+            if file_path.lower().endswith(extension):
+                return name
+        return "csv"
+
+    def write(self, df, base_path, file_format=None):
+        file_format = file_format or self.default_format()
+        extension, writer, _, _, _ = self.FORMATS[file_format]
+        filename = base_path + extension
+        try:
+            writer(df, filename, self.config.get("history_compression"))
+            return filename, file_format
+        except Exception as e:
+            if os.path.exists(filename):
+                os.unlink(filename)
+            if file_format == "csv":
+                raise
+            print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Could not save as {file_format} ({str(e)}), falling back to csv{self.config.RESET_COLOR}")
+            return self.write(df, base_path, "csv")
+
+    def read(self, file_path, file_format=None, resolve=True):
+        file_format = file_format or self.format_for_path(file_path)
+        if file_format not in self.FORMATS:
+            file_format = self.format_for_path(file_path)
+        df = self.FORMATS[file_format][2](file_path)
+        rows = read_rows(file_path) if resolve and file_format in DELTA_FORMATS else None
+        if rows is not None and rows['base']:
+            # A delta only holds the rows its base did not have; the rest come from the base
+            if not os.path.exists(rows['base']):
+                raise FileNotFoundError(f"{file_path} is stored as changes to {rows['base']}, which is no longer in history")
+            df = assemble(self.read(rows['base'], rows['base_format']), df, rows)
+        return df
+
+    def open_chunk_writer(self, base_path, file_format=None):
+        file_format = file_format or self.default_format()
+        if self.FORMATS[file_format][3] is None or (file_format in ("parquet", "feather") and not _has_pyarrow()):
+            file_format = "csv"
+        extension, _, _, chunk_writer, _ = self.FORMATS[file_format]
+        return chunk_writer(base_path + extension, file_format, self.config.get("history_compression"))
+
+    def iter_chunks(self, file_path, file_format=None, chunk_rows=50000):
+        # Reads a file piece by piece; formats without a chunk reader, and deltas, are read whole
+        file_format = file_format or self.format_for_path(file_path)
+        chunk_reader = self.FORMATS[file_format][4]
+        rows = read_rows(file_path) if file_format in DELTA_FORMATS else None
+        if chunk_reader is None or (rows is not None and rows['base']):
+            yield self.read(file_path, file_format)
+            return
+        yield from chunk_reader(file_path, chunk_rows)
+
+def _has_pyarrow():
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+class _ChunkWriter:
+    def __init__(self, file_path, file_format, compression):
+        self.file_path = file_path
+        self.file_format = file_format
+        self.compression = compression
+        self.row_count = 0
+
+    def write(self, chunk):
+        self._write(chunk)
+        self.row_count += len(chunk)
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self.file_path):
+            os.unlink(self.file_path)
+
+class _CsvChunkWriter(_ChunkWriter):
+    def _write(self, chunk):
+        chunk.to_csv(self.file_path, mode='a', header=self.row_count == 0, index=False)
+
+    def close(self):
+        pass
+
+class _ArrowChunkWriter(_ChunkWriter):
+    def __init__(self, file_path, file_format, compression):
+        super().__init__(file_path, file_format, compression)
+        self.writer = None
+        self.schema = None
+
+    def _write(self, chunk):
+        import pyarrow as pa
+        if self.writer is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            # A column that is all NULL in the first chunk has no type yet; store it as text
+            self.schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                     for field in table.schema]).remove_metadata()
+            self.writer = self._open(self.schema)
+        for field in self.schema:
+            if pa.types.is_string(field.type) and chunk[field.name].dtype != object:
+                chunk[field.name] = chunk[field.name].astype(str).where(chunk[field.name].notna(), None)
+        self.writer.write_table(pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+class _ParquetChunkWriter(_ArrowChunkWriter):
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.file_path, schema, compression=self.compression)
+
+class _FeatherChunkWriter(_ArrowChunkWriter):
+    def _open(self, schema):
+        import pyarrow as pa
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(self.file_path, schema, options=options)
+
+def _write_parquet(df, filename, compression):
+    df.to_parquet(filename, index=False, compression=compression)
+
+def _write_feather(df, filename, compression):
+    df.reset_index(drop=True).to_feather(filename, compression=compression)
+
+def _write_csv(df, filename, compression):
+    df.to_csv(filename, index=False)
+
+def _read_parquet(file_path):
+    import pandas as pd
+    return pd.read_parquet(file_path)
+
+def _read_feather(file_path):
+    import pandas as pd
+    return pd.read_feather(file_path)
+
+def _read_csv(file_path):
+    from rgwfuncs import load_data_from_path
+    return load_data_from_path(file_path)
+
+def _iter_parquet(file_path, chunk_rows):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+def _iter_feather(file_path, chunk_rows):
+    import pyarrow as pa
+    with pa.memory_map(file_path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).to_pandas()
+
+def _iter_csv(file_path, chunk_rows):
+    import pandas as pd
+    yield from pd.read_csv(file_path, chunksize=chunk_rows)
+
+ResultStorage.register_format("parquet", ".parquet", _write_parquet, _read_parquet, _ParquetChunkWriter, _iter_parquet)
+ResultStorage.register_format("feather", ".feather", _write_feather, _read_feather, _FeatherChunkWriter, _iter_feather)
+ResultStorage.register_format("csv", ".csv", _write_csv, _read_csv, _CsvChunkWriter, _iter_csv)
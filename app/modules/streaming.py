@@ -0,0 +1,158 @@
+import os
+import threading
+from datetime import datetime
+from .config import Config
+from .drivers import PresetDrivers
+from .df_utils import DataFrameUtils
+from .cancellation import current_cancellation
+
+class MemoryBudget:
+    def __init__(self, limit_bytes):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self.cond:
+            # A single reservation larger than the whole budget is let through once
+            # nothing else is held, otherwise it would wait forever
+            while self.used_bytes and self.used_bytes + nbytes > self.limit_bytes:
+                self.cond.wait()
+            self.used_bytes += nbytes
+
+    def release(self, nbytes):
+        with self.cond:
+            self.used_bytes -= nbytes
+            self.cond.notify_all()
+
+class SpilledResult:
+    def __init__(self, df_name, file_path, file_format, row_count, columns, preview, df_utils):
+        self.df_name = df_name
+        self.file_path = file_path
+        self.file_format = file_format
+        self.row_count = row_count
+        self.columns = columns
+        self.col_count = len(columns)
+        self.preview = preview
+        self.df_utils = df_utils
+
+    def load(self):
+        return self.df_utils.load_data_from_path(self.file_path, self.file_format)
+
+    def __repr__(self):
+        return (f"{self.preview}\n\n[{self.row_count} rows x {len(self.columns)} columns streamed to {self.file_path}; "
+                f"use {self.df_name} = {self.df_name}.load() to materialize]")
+
+class StreamingFetcher:
+    def __init__(self, pool):
+        self.config = Config()
+        self.drivers = PresetDrivers()
+        self.pool = pool
+        self.df_utils = DataFrameUtils()
+        self.budget = MemoryBudget(int(self.config.get("memory_budget_mb")) * 1024 * 1024)
+
+    def requested(self, options):
+        stream = options.get('stream', self.config.get("stream"))
+        return str(stream).lower() in ('1', 'true', 'yes')
+
+    def enabled(self, preset, options):
+        if not self.requested(options):
+            return False
+        if not self.drivers.supports(preset):
+            print(f"{self.config.HEADING_COLOR}Warning:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}Preset '{preset}' has no streaming driver, fetching it in one piece{self.config.RESET_COLOR}")
+            return False
+        return True
+
+    def fetch(self, df_name, preset, query, profile):
+        import pandas as pd
+        chunk_rows = int(self.config.get("stream_chunk_rows"))
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        writer = self.df_utils.storage.open_chunk_writer(f"{self.config.HISTORY_DIR}/{timestamp}")
+        preview = None
+        # Until the first chunk is measured, assume ~1 KB per row
+        reserved = chunk_rows * 1024
+        byte_size = 0
+        cancellation = current_cancellation()
+
+        with profile.phase('connect'):
+            conn = self.pool.acquire(preset)
+        reusable = False
+        try:
+            cursor = conn.cursor()
+            with cancellation.cancelling(self.drivers.canceller(preset, conn) or (lambda: None)):
+                with profile.phase('execute'):
+                    cursor.execute(query)
+                columns = [d[0] for d in cursor.description]
+                while True:
+                    self.budget.acquire(reserved)
+                    try:
+                        if cancellation.cancelled:
+                            raise TimeoutError("query was cancelled")
+                        with profile.phase('fetch'):
+                            rows = cursor.fetchmany(chunk_rows)
+                        if not rows:
+                            break
+                        profile.add_rows(len(rows))
+                        with profile.phase('build'):
+                            chunk = pd.DataFrame.from_records(rows, columns=columns)
+                        if preview is None:
+                            preview = chunk.head(10)
+                        chunk_bytes = int(chunk.memory_usage(deep=True).sum())
+                        byte_size += chunk_bytes
+                        # Raw rows and the chunk frame are alive together, hence the factor of two
+                        next_reserved = chunk_bytes * 2
+                        profile.estimate_memory(next_reserved)
+                        with profile.phase('persist'):
+                            writer.write(chunk)
+                        del rows, chunk
+                    finally:
+                        self.budget.release(reserved)
+                    reserved = next_reserved
+            cursor.close()
+            reusable = not cancellation.cancelled
+            if writer.row_count == 0:
+                writer.write(pd.DataFrame(columns=columns))
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            self.pool.release(preset, conn, reusable)
+
+        if preview is None:
+            preview = pd.DataFrame(columns=columns)
+        profile.row_count = writer.row_count
+        profile.col_count = len(columns)
+        profile.byte_size = byte_size
+        return SpilledResult(df_name, writer.file_path, writer.file_format, writer.row_count, columns, preview, self.df_utils)
+
+    def concat(self, df_name, parts):
+        # Partitions streamed to their own files are copied, chunk by chunk, into one
+        import pandas as pd
+        chunk_rows = int(self.config.get("stream_chunk_rows"))
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        writer = self.df_utils.storage.open_chunk_writer(f"{self.config.HISTORY_DIR}/{timestamp}")
+        columns = list(parts[0].columns)
+        preview = None
+        try:
+            for part in parts:
+                if isinstance(part, SpilledResult):
+                    chunks = self.df_utils.storage.iter_chunks(part.file_path, part.file_format, chunk_rows)
+                else:
+                    chunks = [part]
+                for chunk in chunks:
+                    if preview is None and len(chunk):
+                        preview = chunk.head(10)
+                    writer.write(chunk)
+            if writer.row_count == 0:
+                writer.write(pd.DataFrame(columns=columns))
+            writer.close()
+        except Exception:
+            writer.abort()
+            raise
+        for part in parts:
+            if isinstance(part, SpilledResult) and os.path.exists(part.file_path):
+                os.unlink(part.file_path)
+        if preview is None:
+            preview = pd.DataFrame(columns=columns)
+        return SpilledResult(df_name, writer.file_path, writer.file_format, writer.row_count, columns, preview, self.df_utils)
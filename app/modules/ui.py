@@ -8,6 +8,8 @@ class UI:
 
     def animate_loading(self, message, duration=1):
         spinner = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
+        if self.config.get("fast_start"):
+            duration = 0
         end_time = time.time() + duration
         while time.time() < end_time:
             for char in spinner:
@@ -18,6 +20,10 @@ class UI:
         sys.stdout.flush()
 
     def typewriter_print(self, text, delay=0.001):
+        if self.config.get("fast_start"):
+            sys.stdout.write(text + '\n')
+            sys.stdout.flush()
+            return
         for char in text:
             sys.stdout.write(char)
             sys.stdout.flush()
@@ -0,0 +1,60 @@
+import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from .config import Config
+
+class HistoryWriter:
+    def __init__(self, db):
+        self.config = Config()
+        self.db = db
+        self.pool = ThreadPoolExecutor(max_workers=max(1, int(self.config.get("history_writers"))), thread_name_prefix="history-writer")
+        # A single committer inserts each run's entries in one transaction once its files are written
+        self.committer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-commit")
+        self.lock = threading.Lock()
+        self.runs = {}
+        atexit.register(self.flush)
+
+    def submit_run(self, entries):
+        if not entries:
+            return None
+        writes = [(entry['df_name'], self.pool.submit(self.db.prepare_history_entry, **entry)) for entry in entries]
+        with self.lock:
+            commit = self.committer.submit(self._commit_run, writes)
+            self.runs[commit] = (writes, time.time())
+        commit.add_done_callback(self._forget)
+        return commit
+
+    def _commit_run(self, writes):
+        rows = []
+        for df_name, future in writes:
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                print(f"{self.config.HEADING_COLOR}Error saving history for {df_name}:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}{str(e)}{self.config.RESET_COLOR}")
+        self.db.insert_history_entries(rows)
+
+    def _forget(self, commit):
+        with self.lock:
+            self.runs.pop(commit, None)
+
+    def flush(self):
+        with self.lock:
+            commits = list(self.runs)
+            count = sum(len(writes) for writes, _ in self.runs.values())
+        if commits:
+            print(f"{self.config.HEADING_COLOR}Waiting for {count} history write(s) to finish...{self.config.RESET_COLOR}")
+            wait(commits)
+
+    def pending_writes(self):
+        with self.lock:
+            runs = list(self.runs.values())
+        if not runs:
+            print(f"{self.config.HEADING_COLOR}Pending writes:{self.config.RESET_COLOR} {self.config.CONTENT_COLOR}All history writes are complete.{self.config.RESET_COLOR}")
+            return
+        print(f"{self.config.HEADING_COLOR}Pending writes:{self.config.RESET_COLOR}")
+        for writes, submitted_at in runs:
+            elapsed = time.time() - submitted_at
+            for df_name, future in writes:
+                state = "written, waiting for history commit" if future.done() else "writing"
+                print(f"{self.config.CONTENT_COLOR}  {df_name}: {state} ({elapsed:.1f}s){self.config.RESET_COLOR}")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Measure how a run scales with the number of directives against a local SQLite preset.
+
+    python benchmarks/bench_concurrency.py [--sizes 1,10,50,100,250,500] [--rows 1000]
+        [--latency-ms 50] [--max-workers 8] [--history-format parquet] [--stream] [--output results.json]
+
+For every size N a synthetic tree of N directives is written next to a SQLite
+file preset and run by process_all_queries in a fresh interpreter, so peak RSS
+is measured per size. Each query sleeps for --latency-ms as it executes, with
+or without --stream, to stand in for a remote server. Reported per size: wall time until all results
+are in the namespace, throughput, peak RSS and the cost of writing history
+(time spent persisting in the background plus the wait to flush it).
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+import platform
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = r'''
+import io
+import os
+import sys
+import json
+import time
+import sqlite3
+import resource
+import contextlib
+sys.path.insert(0, {app_dir!r})
+from modules.config import Config
+from modules.drivers import PresetDrivers
+from modules.history_manager import HistoryManager
+from modules.query_processor import QueryProcessor
+
+for key, value in {overrides!r}.items():
+    Config.override(key, value)
+
+# The latency goes into the preset connection's execute, which plain and streamed fetches share
+class DelayedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        time.sleep({latency_s!r})
+        return super().execute(*args)
+
+class DelayedConnection(sqlite3.Connection):
+    def cursor(self, factory=DelayedCursor):
+        return super().cursor(factory)
+
+PresetDrivers.CONNECTORS['sqlite'] = lambda preset: sqlite3.connect(
+    os.path.expanduser(preset['db_path']), check_same_thread=False, factory=DelayedConnection)
+
+history_manager = HistoryManager()
+processor = QueryProcessor(history_manager)
+filepaths = processor.file_utils.get_sql_files([{tree!r}])
+namespace = {{}}
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import pandas
+    started = time.perf_counter()
+    processor.process_all_queries(filepaths, namespace, history_manager.db.save_history_entry)
+    wall = time.perf_counter() - started
+    processor.writer.flush()
+    flush_wait = time.perf_counter() - started - wall
+
+with history_manager.db.connection.cursor() as c:
+    persist_s, failed = c.execute("SELECT SUM(persist_s), SUM(status != 'ok') FROM query_history").fetchone()
+
+print("RESULT " + json.dumps({{
+    "wall_s": wall,
+    "flush_wait_s": flush_wait,
+    "persist_s": persist_s or 0.0,
+    "failed": failed or 0,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+'''
+
+
+def read_version():
+    """Return the version string from pyproject.toml."""
+    with open(os.path.join(ROOT, "pyproject.toml"), "r", encoding="utf-8") as f:
+        match = re.search(r'version\s*=\s*"([^"]+)"', f.read())
+    return match.group(1) if match else "unknown"
+
+
+def write_workspace(root, directives, rows, per_file):
+    """Create a HOME with a SQLite preset holding `rows` rows and a tree of `directives` directives."""
+    db_path = os.path.join(root, "bench.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE events (id INTEGER, name TEXT, amount REAL, day TEXT)")
+    conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?)",
+                     ((i, f"name_{i % 50}", i * 0.5, f"2024-01-{i % 28 + 1:02d}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+    with open(os.path.join(root, ".rgwfuncsrc"), "w") as f:
+        json.dump({"db_presets": [{"name": "bench", "db_type": "sqlite", "db_path": db_path}]}, f)
+
+    tree = os.path.join(root, "tree")
+    for i in range(directives):
+        subdir = os.path.join(tree, f"team_{i // (per_file * 10)}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"queries_{i // per_file}.sql"), "a") as f:
+            # The directive number is part of the SQL so no two queries hit the result cache
+            f.write(f"df_{i}@preset::bench\nSELECT id, name, amount, day, {i} AS directive FROM events\n\n")
+    return tree
+
+
+def run_size(directives, args, overrides):
+    """Run one synthetic tree of the given size in a new interpreter and return its measurements."""
+    with tempfile.TemporaryDirectory() as root:
+        tree = write_workspace(root, directives, args.rows, args.per_file)
+        code = CHILD.format(app_dir=os.path.join(ROOT, "app"), overrides=overrides,
+                            latency_s=args.latency_ms / 1000, tree=tree)
+        env = dict(os.environ, HOME=root)
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, timeout=3600)
+    match = re.search(r"^RESULT (.*)$", result.stdout, re.MULTILINE)
+    if not match:
+        raise RuntimeError(f"benchmark run for {directives} directives failed:\n{result.stdout}\n{result.stderr}")
+    measured = json.loads(match.group(1))
+    measured["directives"] = directives
+    measured["throughput_qps"] = directives / measured["wall_s"] if measured["wall_s"] else None
+    measured["history_write_s"] = measured["persist_s"] + measured["flush_wait_s"]
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,50,100,250,500", help="comma separated directive counts")
+    parser.add_argument("--rows", type=int, default=1000, help="rows returned by every query")
+    parser.add_argument("--latency-ms", type=float, default=50, help="artificial latency added to every query")
+    parser.add_argument("--per-file", type=int, default=25, help="directives per .sql file")
+    parser.add_argument("--max-workers", type=int, help="override max_workers")
+    parser.add_argument("--history-format", choices=["parquet", "feather", "csv"], help="override history_format")
+    parser.add_argument("--stream", action="store_true", help="stream every result to disk")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    overrides = {"fast_start": True}
+    if args.max_workers:
+        overrides["max_workers"] = args.max_workers
+    if args.history_format:
+        overrides["history_format"] = args.history_format
+    if args.stream:
+        overrides["stream"] = True
+
+    results = []
+    print(f"{'N':>5}  {'wall':>8}  {'q/s':>8}  {'peak RSS':>10}  {'history write':>13}  {'failed':>6}")
+    for directives in [int(n) for n in args.sizes.split(",") if n.strip()]:
+        measured = run_size(directives, args, overrides)
+        results.append(measured)
+        print(f"{directives:5d}  {measured['wall_s']:7.2f}s  {measured['throughput_qps']:8.1f}  "
+              f"{measured['peak_rss_mb']:7.1f} MB  {measured['history_write_s']:12.2f}s  {measured['failed']:6d}")
+
+    report = {
+        "benchmark": "concurrency",
+        "version": read_version(),
+        "python": platform.python_version(),
+        "rows": args.rows,
+        "latency_ms": args.latency_ms,
+        "settings": overrides,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Time the .sql parser on a synthetic tree of directives.
+
+    python benchmarks/bench_parser.py [--directives 10000] [--per-file 50]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from modules.file_utils import FileUtils
+
+
+def write_tree(root, directives, per_file):
+    """Write directives spread over nested .sql files, with the comment styles parsing has to skip."""
+    for i in range(directives):
+        subdir = os.path.join(root, f"team_{i // (per_file * 20)}")
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f"queries_{i // per_file}.sql"), "a") as f:
+            f.write(f"/* Directive {i}\n   generated for the parser benchmark */\n")
+            f.write(f"df_{i}@preset::warehouse_{i % 4}@ttl::1h\n")
+            f.write(f"SELECT id, name, amount -- columns\nFROM events_{i % 50}\n")
+            f.write(f"WHERE day >= '2024-01-01' AND bucket = {i % 7}\n\n")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--directives", type=int, default=10000)
+    parser.add_argument("--per-file", type=int, default=50)
+    args = parser.parse_args()
+
+    file_utils = FileUtils()
+    with tempfile.TemporaryDirectory() as root:
+        write_tree(root, args.directives, args.per_file)
+        filepaths = file_utils.get_sql_files([root])
+
+        FileUtils._manifest_cache.clear()
+        cold, manifest = timed(lambda: file_utils.collect_manifest(filepaths))
+        warm, _ = timed(lambda: file_utils.collect_manifest(filepaths))
+
+        # What a run does at startup: conflict check, execution manifest and historic()
+        FileUtils._manifest_cache.clear()
+        startup, _ = timed(lambda: (file_utils.check_df_conflicts(filepaths),
+                                    file_utils.collect_manifest(filepaths),
+                                    file_utils.collect_manifest(filepaths)))
+
+    assert len(manifest) == args.directives, f"parsed {len(manifest)} of {args.directives} directives"
+    print(f"{args.directives} directives in {len(filepaths)} files")
+    print(f"  cold parse:        {cold * 1000:8.1f} ms  ({args.directives / cold:,.0f} directives/s)")
+    print(f"  cached parse:      {warm * 1000:8.1f} ms")
+    print(f"  startup (3 reads): {startup * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
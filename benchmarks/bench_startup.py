@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Measure time from process start to the first query dispatch.
+
+    python benchmarks/bench_startup.py [--runs 5] [--directives 30] [--output results.json]
+
+Each run starts datasling in a fresh interpreter against a throwaway HOME and
+stops it the moment the first query would be sent, once in the default mode
+and once with --fast. Results are tagged with the version in pyproject.toml
+so runs from different releases can be compared.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CHILD = r'''
+import os
+import sys
+import time
+sys.path.insert(0, {app_dir!r})
+sys.argv = ["datasling"] + {argv!r}
+import main
+from modules.query_processor import QueryProcessor
+
+def first_dispatch(self, *args, **kwargs):
+    sys.stdout.write(f"DISPATCH {{time.time()}}\n")
+    sys.stdout.flush()
+    os._exit(0)
+
+QueryProcessor.process_query = first_dispatch
+main.main()
+'''
+
+
+def read_version():
+    """Return the version string from pyproject.toml."""
+    with open(os.path.join(ROOT, "pyproject.toml"), "r", encoding="utf-8") as f:
+        match = re.search(r'version\s*=\s*"([^"]+)"', f.read())
+    return match.group(1) if match else "unknown"
+
+
+def write_workspace(root, directives):
+    """Create a HOME with a sqlite preset and a .sql file with the given number of directives."""
+    with open(os.path.join(root, ".rgwfuncsrc"), "w") as f:
+        json.dump({"db_presets": [{"name": "bench", "db_type": "sqlite", "db_path": os.path.join(root, "bench.db")}]}, f)
+    with open(os.path.join(root, "startup.sql"), "w") as f:
+        for i in range(directives):
+            f.write(f"df_{i}@preset::bench\nSELECT {i} AS value\n\n")
+
+
+def time_to_dispatch(root, argv, fast):
+    """Start datasling in a new interpreter and return seconds until its first dispatch."""
+    env = dict(os.environ, HOME=root)
+    env.pop("DATASLING_FAST", None)
+    if fast:
+        env["DATASLING_FAST"] = "1"
+    code = CHILD.format(app_dir=os.path.join(ROOT, "app"), argv=argv)
+    started = time.time()
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, timeout=300)
+    match = re.search(r"DISPATCH ([0-9.]+)", result.stdout)
+    if not match:
+        raise RuntimeError(f"datasling exited before dispatching a query:\n{result.stdout}\n{result.stderr}")
+    return float(match.group(1)) - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--directives", type=int, default=30)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        write_workspace(root, args.directives)
+        for mode, fast in (("default", False), ("fast", True)):
+            samples = [time_to_dispatch(root, ["startup.sql"], fast) for _ in range(args.runs)]
+            results[mode] = {
+                "median_s": statistics.median(samples),
+                "min_s": min(samples),
+                "max_s": max(samples),
+                "samples_s": samples,
+            }
+            print(f"{mode:8s} time to first dispatch: median {results[mode]['median_s']:.3f}s "
+                  f"(min {results[mode]['min_s']:.3f}s, max {results[mode]['max_s']:.3f}s)")
+
+    report = {
+        "benchmark": "startup",
+        "version": read_version(),
+        "python": platform.python_version(),
+        "directives": args.directives,
+        "runs": args.runs,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
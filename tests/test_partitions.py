@@ -0,0 +1,19 @@
+from app.modules.partitions import PartitionPlanner, sql_literal
+
+def test_integers_stay_bare():
+    assert sql_literal(5) == "5"
+    assert sql_literal("12") == "12"
+    assert sql_literal("-5") == "-5"
+    assert sql_literal("0") == "0"
+
+def test_leading_zero_keys_are_quoted():
+    assert sql_literal("007") == "'007'"
+    assert sql_literal("00501") == "'00501'"
+
+def test_quoted_values_are_strings():
+    assert sql_literal("'501'") == "'501'"
+    assert sql_literal("o'brien") == "'o''brien'"
+
+def test_list_partition_keeps_zip_codes_as_strings():
+    predicates = PartitionPlanner().plan({'partition': "zip:00501,10001,'94105'", 'parts': '1'})
+    assert predicates == ["zip IN ('00501', 10001, '94105')"]